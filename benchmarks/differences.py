@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark the sorted-merge diff engine against the previous dict based
+`differences` on two synthetic package listings:
+
+    $ python3 benchmarks/differences.py --packages 200000
+
+Memory is the tracemalloc peak of producing both listings and diffing them.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from nixpkgs_review.review import (  # noqa: E402
+    Package,
+    SortedPackages,
+    diff_sorted_packages,
+    differences,
+)
+
+
+def listing(packages: int, changed_every: int) -> Iterator[Package]:
+    "Yields packages sorted by attribute path, every nth one has a new output"
+    for i in range(packages):
+        name = f"package{i:07d}"
+        suffix = "-new" if changed_every and i % changed_every == 0 else ""
+        yield Package(
+            pname=name,
+            version="1.0",
+            attr_path=name,
+            store_path=f"/nix/store/{i:032d}-{name}{suffix}",
+            homepage=None,
+            description=None,
+            position=None,
+        )
+
+
+def legacy_differences(
+    old: List[Package], new: Iterable[Package]
+) -> Tuple[List[Package], List[Package]]:
+    "The implementation before the merge engine"
+    old_attrs = dict((pkg.attr_path, pkg) for pkg in old)
+    changed_packages = []
+    for new_pkg in new:
+        old_pkg = old_attrs.get(new_pkg.attr_path, None)
+        if old_pkg is None or old_pkg.store_path != new_pkg.store_path:
+            new_pkg.old_pkg = old_pkg
+            changed_packages.append(new_pkg)
+        if old_pkg:
+            del old_attrs[old_pkg.attr_path]
+
+    return (changed_packages, list(old_attrs.values()))
+
+
+def legacy(packages: int) -> int:
+    old = list(listing(packages, 0))
+    changed, removed = legacy_differences(old, listing(packages, 100))
+    return len(changed) + len(removed)
+
+
+def lists(packages: int) -> int:
+    # without the evaluation cache the new listing is streamed from nix-env
+    changed, removed = differences(list(listing(packages, 0)), listing(packages, 100))
+    return len(changed) + len(removed)
+
+
+def sorted_lists(packages: int) -> int:
+    changed, removed = differences(
+        SortedPackages(listing(packages, 0)), SortedPackages(listing(packages, 100))
+    )
+    return len(changed) + len(removed)
+
+
+def streams(packages: int) -> int:
+    return sum(
+        1 for _ in diff_sorted_packages(listing(packages, 0), listing(packages, 100))
+    )
+
+
+IMPLEMENTATIONS: Dict[str, Callable[[int], int]] = {
+    "legacy": legacy,
+    "differences": lists,
+    "sorted-lists": sorted_lists,
+    "sorted-streams": streams,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    for name, implementation in IMPLEMENTATIONS.items():
+        tracemalloc.start()
+        start = time.perf_counter()
+        count = implementation(args.packages)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+        print(f"{name:>15}: {count} differences, {elapsed:.2f}s, peak {peak:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark `parse_packages_xml` on a synthetic `nix-env -qaP --xml --meta`
+listing and compare it with the previous, non-streaming implementation.
+
+Each implementation runs in its own interpreter so that the reported peak RSS
+is not influenced by the other runs:
+
+    $ python3 benchmarks/parse_packages_xml.py --items 100000
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from tempfile import TemporaryDirectory
+from typing import IO, Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from nixpkgs_review.review import Package, parse_packages_xml  # noqa: E402
+
+
+def write_listing(path: str, items: int) -> None:
+    with open(path, "w") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<items>\n")
+        for i in range(items):
+            name = f"package{i}"
+            version = f"{i % 17}.{i % 5}"
+            f.write(
+                f'  <item attrPath="pkgs{i % 10}.{name}" name="{name}-{version}" '
+                f'pname="{name}" system="x86_64-linux" version="{version}">\n'
+                f'    <output name="out" path="/nix/store/{i:032d}-{name}-{version}" />\n'
+                '    <meta name="available" type="bool" value="true" />\n'
+                f'    <meta name="description" type="string" value="Synthetic package number {i}" />\n'
+                f'    <meta name="homepage" type="string" value="https://example.com/{name}" />\n'
+                '    <meta name="license" type="strings">\n'
+                '      <string type="spdxId" value="MIT" />\n'
+                '      <string type="shortName" value="mit" />\n'
+                "    </meta>\n"
+                '    <meta name="platforms" type="strings">\n'
+                '      <string value="aarch64-linux" />\n'
+                '      <string value="x86_64-linux" />\n'
+                "    </meta>\n"
+                f'    <meta name="position" type="string" value="/home/user/nixpkgs/pkgs/{name}/default.nix:{i % 40}" />\n'
+                "  </item>\n"
+            )
+        f.write("</items>\n")
+
+
+def legacy_parse_packages_xml(stdout: IO[Any]) -> List[Package]:
+    "The implementation before streaming, which keeps the whole document tree"
+    packages: List[Package] = []
+    path = None
+    context = ET.iterparse(stdout, events=("start", "end"))
+    for event, elem in context:
+        if elem.tag == "item":
+            if event == "start":
+                attrs = elem.attrib
+                homepage = None
+                description = None
+                position = None
+                path = None
+            else:
+                if path is None:
+                    continue
+                pkg = Package(
+                    pname=attrs["pname"],
+                    version=attrs["version"],
+                    attr_path=attrs["attrPath"],
+                    store_path=path,
+                    homepage=homepage,
+                    description=description,
+                    position=position,
+                )
+                packages.append(pkg)
+        elif event == "start" and elem.tag == "output" and elem.attrib["name"] == "out":
+            path = elem.attrib["path"]
+        elif event == "start" and elem.tag == "meta":
+            name = elem.attrib["name"]
+            if name not in ["homepage", "description", "position"]:
+                continue
+            if elem.attrib["type"] == "strings":
+                value = ", ".join(e.attrib["value"] for e in elem)
+            else:
+                value = elem.attrib["value"]
+            if name == "homepage":
+                homepage = value
+            elif name == "description":
+                description = value
+            elif name == "position":
+                position = value
+    return packages
+
+
+def legacy(f: IO[Any]) -> int:
+    return len(legacy_parse_packages_xml(f))
+
+
+def streaming_list(f: IO[Any]) -> int:
+    return len(list(parse_packages_xml(f)))
+
+
+def streaming(f: IO[Any]) -> int:
+    return sum(1 for _ in parse_packages_xml(f))
+
+
+IMPLEMENTATIONS: Dict[str, Callable[[IO[Any]], int]] = {
+    "legacy": legacy,
+    "streaming-list": streaming_list,
+    "streaming": streaming,
+}
+
+
+def run(implementation: str, listing: str) -> None:
+    start = time.perf_counter()
+    with open(listing, "rb") as f:
+        count = IMPLEMENTATIONS[implementation](f)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{implementation:>15}: {count} packages, {elapsed:.2f}s, "
+        f"{count / elapsed:,.0f} packages/s, peak RSS {rss:.1f} MiB"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--run", choices=IMPLEMENTATIONS.keys())
+    parser.add_argument("--listing")
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.listing)
+        return
+
+    with TemporaryDirectory() as directory:
+        listing = os.path.join(directory, "packages.xml")
+        write_listing(listing, args.items)
+        size = os.path.getsize(listing) / 1024 / 1024
+        print(f"synthetic listing: {args.items} items, {size:.1f} MiB")
+        for implementation in IMPLEMENTATIONS:
+            subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--run",
+                    implementation,
+                    "--listing",
+                    listing,
+                ],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
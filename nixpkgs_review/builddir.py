@@ -3,10 +3,11 @@ import shutil
 import signal
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any, Union
+from typing import Any, Optional, Union
 
 from .overlay import Overlay
-from .utils import sh, warn
+from .utils import cache_home, sh, warn
+from .worktree import Worktree, WorktreePool
 
 
 class DisableKeyboardInterrupt:
@@ -22,47 +23,95 @@ class DisableKeyboardInterrupt:
         signal.signal(signal.SIGINT, self.old_handler)
 
 
-def create_cache_directory(name: str) -> Union[Path, "TemporaryDirectory[str]"]:
-    xdg_cache_raw = os.environ.get("XDG_CACHE_HOME")
-    if xdg_cache_raw is not None:
-        xdg_cache = Path(xdg_cache_raw)
-    else:
-        home = os.environ.get("HOME", None)
-        if home is None:
-            # we are in a temporary directory
-            return TemporaryDirectory()
-        else:
-            xdg_cache = Path(home).joinpath(".cache")
+def find_cache_directory(cache: Path, name: str) -> Optional[Path]:
+    """
+    Returns the most recent directory created by `create_cache_directory` for
+    `name`
+    """
+    found = None
+    counter = 0
+    while True:
+        path = cache.joinpath(name if counter == 0 else f"{name}-{counter}")
+        if not path.exists():
+            return found
+        found = path
+        counter += 1
+
+
+def create_cache_directory(
+    name: str, resume: bool = False
+) -> Union[Path, "TemporaryDirectory[str]"]:
+    xdg_cache = cache_home()
+    if xdg_cache is None:
+        # we are in a temporary directory
+        return TemporaryDirectory()
+
+    if resume:
+        previous = find_cache_directory(xdg_cache, name)
+        if previous is not None:
+            return previous
+        warn(f"No previous review of {name} found, starting over")
 
     counter = 0
     while True:
         try:
             final_name = name if counter == 0 else f"{name}-{counter}"
-            cache_home = xdg_cache.joinpath("nixpkgs-review", final_name)
-            cache_home.mkdir(parents=True)
-            return cache_home
+            cache_dir = xdg_cache.joinpath(final_name)
+            cache_dir.mkdir(parents=True)
+            return cache_dir
         except FileExistsError:
             counter += 1
 
 
 class Builddir:
-    def __init__(self, name: str) -> None:
+    def __init__(
+        self,
+        name: str,
+        resume: bool = False,
+        worktree_pool: Optional[WorktreePool] = None,
+    ) -> None:
         self.environ = os.environ.copy()
-        self.directory = create_cache_directory(name)
+        self.directory = create_cache_directory(name, resume)
         if isinstance(self.directory, TemporaryDirectory):
             self.path = Path(self.directory.name)
         else:
             self.path = self.directory
 
         self.worktree_dir = self.path.joinpath("nixpkgs")
+        # only checked out when base and merged tree are evaluated in parallel
+        self.base_worktree_dir = self.path.joinpath("nixpkgs-base")
         self.overlay = Overlay()
 
-        self.worktree_dir.mkdir()
+        if resume:
+            self.remove_leftover_worktrees()
+
+        # a leased worktree is linked into the build directory and checked out
+        # by resetting it, see `Review.git_worktree`
+        self.worktree: Optional[Worktree] = None
+        if worktree_pool is None:
+            self.worktree_dir.mkdir()
+        else:
+            self.worktree = worktree_pool.lease()
+            self.worktree_dir.symlink_to(self.worktree.path)
 
         self.worktree_dir = self.worktree_dir
 
         os.environ["NIX_PATH"] = self.nixpkgs_path()
 
+    def remove_leftover_worktrees(self) -> None:
+        """
+        Removes the worktrees left behind by a review that was killed
+        """
+        if self.worktree_dir.is_symlink():
+            self.worktree_dir.unlink()
+        removed = False
+        for worktree in (self.worktree_dir, self.base_worktree_dir):
+            if worktree.exists():
+                shutil.rmtree(worktree)
+                removed = True
+        if removed:
+            sh(["git", "worktree", "prune"])
+
     def nixpkgs_path(self) -> str:
         return f"nixpkgs={self.worktree_dir}:nixpkgs-overlays={self.overlay.path}"
 
@@ -74,7 +123,13 @@ class Builddir:
         os.environ.update(self.environ)
 
         with DisableKeyboardInterrupt():
-            shutil.rmtree(self.worktree_dir)
+            if self.worktree is None:
+                shutil.rmtree(self.worktree_dir)
+            else:
+                self.worktree_dir.unlink()
+                self.worktree.release()
+            if self.base_worktree_dir.exists():
+                shutil.rmtree(self.base_worktree_dir)
             sh(["git", "worktree", "prune"])
 
         self.overlay.cleanup()
@@ -6,6 +6,7 @@ from typing import Any, List, Optional, Pattern
 
 from .approve import approve_command
 from .comments import show_comments
+from .history import history_command
 from .merge import merge_command
 from .post_result import post_result_command
 from .pr import pr_command
@@ -20,6 +21,26 @@ def regex_type(s: str) -> Pattern[str]:
         raise argparse.ArgumentTypeError(f"'{s}' is not a valid regex: {e}")
 
 
+def positive_int_type(s: str) -> int:
+    try:
+        value = int(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{s}' is not an integer")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"'{s}' must be at least 1")
+    return value
+
+
+def ratio_type(s: str) -> float:
+    try:
+        value = float(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{s}' is not a number")
+    if not 0 < value <= 1:
+        raise argparse.ArgumentTypeError(f"'{s}' must be greater than 0 and at most 1")
+    return value
+
+
 def pr_flags(subparsers: argparse._SubParsersAction) -> argparse.ArgumentParser:
     pr_parser = subparsers.add_parser("pr", help="review a pull request on nixpkgs")
     pr_parser.add_argument(
@@ -51,6 +72,34 @@ def pr_flags(subparsers: argparse._SubParsersAction) -> argparse.ArgumentParser:
         action="store_true",
         help="Post the nixpkgs-review results as a PR comment",
     )
+    pr_parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="When reviewing multiple pull requests, fetch and evaluate the next ones while the current one builds",
+    )
+    pr_parser.add_argument(
+        "--union-build",
+        action="store_true",
+        help="When reviewing multiple pull requests, evaluate all of them first and build the packages of all pull requests with a single nix build",
+    )
+    pr_parser.add_argument(
+        "--fetch-jobs",
+        type=int,
+        default=2,
+        help="Number of pull requests fetched at the same time with --pipeline or --union-build",
+    )
+    pr_parser.add_argument(
+        "--eval-jobs",
+        type=int,
+        default=1,
+        help="Number of pull requests evaluated at the same time with --pipeline or --union-build",
+    )
+    pr_parser.add_argument(
+        "--build-jobs",
+        type=int,
+        default=1,
+        help="Number of pull requests built at the same time with --pipeline",
+    )
     pr_parser.set_defaults(func=pr_command)
     return pr_parser
 
@@ -102,6 +151,22 @@ def wip_flags(subparsers: argparse._SubParsersAction) -> argparse.ArgumentParser
     return wip_parser
 
 
+def history_flags(subparsers: argparse._SubParsersAction) -> argparse.ArgumentParser:
+    history_parser = subparsers.add_parser(
+        "history", help="show previous reviews recorded with --history"
+    )
+    history_parser.add_argument(
+        "-a",
+        "--attr",
+        help="show the outcome and build time of this package in previous reviews",
+    )
+    history_parser.add_argument(
+        "-n", "--limit", type=int, default=20, help="number of entries to show"
+    )
+    history_parser.set_defaults(func=history_command)
+    return history_parser
+
+
 class CommonFlag:
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         self.args = args
@@ -175,6 +240,105 @@ def common_flags() -> List[CommonFlag]:
             action="store_true",
             help="Only evaluate and build without executing nix-shell",
         ),
+        CommonFlag(
+            "--eval-parallel",
+            action="store_true",
+            help="Evaluate the base and the changed nixpkgs in parallel when evaluating locally (needs a second worktree)",
+        ),
+        CommonFlag(
+            "--eval-cache",
+            action="store_true",
+            help="Cache local evaluations of nixpkgs by git tree in the cache directory",
+        ),
+        CommonFlag(
+            "--eval-shards",
+            type=int,
+            default=1,
+            help="Split local evaluation of nixpkgs into this many nix-env processes that run in parallel",
+        ),
+        CommonFlag(
+            "--eval-workers",
+            type=int,
+            default=1,
+            help="Number of parallel nix processes used to evaluate large sets of attributes before building",
+        ),
+        CommonFlag(
+            "--eval-memory-limit",
+            type=int,
+            default=None,
+            help="Memory limit in MiB for each evaluation process",
+        ),
+        CommonFlag(
+            "--eval-incremental",
+            action="store_true",
+            help="Only evaluate packages affected by the changed files (implies --eval-cache)",
+        ),
+        CommonFlag(
+            "--build-tiers",
+            action="store_true",
+            help="Build packages that other changed packages depend on first, in separate nix build calls",
+        ),
+        CommonFlag(
+            "--abort-on-tier-failure",
+            action="store_true",
+            help="Do not build the remaining packages once a package of an earlier tier failed (implies --build-tiers)",
+        ),
+        CommonFlag(
+            "--fail-fast",
+            action="store_true",
+            help="Stop building after the first failed build (same as --max-failures 1)",
+        ),
+        CommonFlag(
+            "--max-failures",
+            type=positive_int_type,
+            default=None,
+            help="Stop building after this many failed builds",
+        ),
+        CommonFlag(
+            "--max-failure-ratio",
+            type=ratio_type,
+            default=None,
+            help="Stop building once the failed builds exceed this share (greater than 0, at most 1) of the packages to build",
+        ),
+        CommonFlag(
+            "--worktree-pool",
+            action="store_true",
+            help="Reuse persistent nixpkgs worktrees in the cache directory and reset them to the reviewed commit instead of checking out a new worktree per review",
+        ),
+        CommonFlag(
+            "--resume",
+            action="store_true",
+            help="Continue the last review of the same pull request or commit: reuse its evaluation and only build packages that were not built successfully",
+        ),
+        CommonFlag(
+            "--logs",
+            default="failed",
+            choices=["failed", "all"],
+            help="Build logs to store in the logs directory of the review",
+        ),
+        CommonFlag(
+            "--log-tail",
+            type=int,
+            default=None,
+            help="Only store the last lines of each build log",
+        ),
+        CommonFlag(
+            "--compress-logs",
+            action="store_true",
+            help="Store build logs gzip compressed",
+        ),
+        CommonFlag(
+            "--history",
+            action="store_true",
+            help="Record the review with the build time of each package in the history database (see the history subcommand)",
+        ),
+        CommonFlag(
+            "--plan",
+            "--dry-run",
+            dest="plan",
+            action="store_true",
+            help="Only show what would be built or fetched and estimate the build time from the history, without building",
+        ),
         CommonFlag(
             "--token",
             type=str,
@@ -219,6 +383,8 @@ def parse_args(command: str, args: List[str]) -> argparse.Namespace:
     )
     merge_parser.set_defaults(func=merge_command)
 
+    history_flags(subparsers)
+
     parsers = [
         approve_parser,
         comments_parser,
@@ -0,0 +1,43 @@
+import argparse
+import sys
+
+from ..history import History, default_history, format_duration, format_time
+from ..utils import warn
+
+
+def print_runs(history: History, limit: int) -> None:
+    for run in reversed(history.runs(limit)):
+        phases = " ".join(
+            f"{name}={format_duration(duration)}"
+            for name, duration in run.phases.items()
+        )
+        total = format_duration(sum(run.phases.values()))
+        print(
+            f"{format_time(run.started)} {run.kind} {run.target} ({run.system}): "
+            f"{run.built} built, {run.failed} failed in {total} [{phases}]"
+        )
+
+
+def print_builds(history: History, attr: str, limit: int) -> None:
+    records = history.builds(attr, limit)
+    if len(records) == 0:
+        warn(f"{attr} was not reviewed yet")
+        sys.exit(1)
+    for record in reversed(records):
+        run = record.run
+        how = "substituted" if record.substituted else record.outcome
+        print(
+            f"{format_time(run.started)} {run.kind} {run.target}: {how} "
+            f"in {format_duration(record.build_time)} {record.drv_path or ''}"
+        )
+
+
+def history_command(args: argparse.Namespace) -> None:
+    history = default_history()
+    if history is None:
+        warn("HOME is not set, cannot find the history database")
+        sys.exit(1)
+    if args.attr is None:
+        print_runs(history, args.limit)
+    else:
+        print_builds(history, args.attr, args.limit)
@@ -3,12 +3,28 @@ import re
 import subprocess
 import sys
 from contextlib import ExitStack
-from typing import List
+from typing import Dict, List, Tuple
 
 from ..builddir import Builddir
 from ..buildenv import Buildenv
-from ..review import CheckoutOption, Review
-from ..utils import warn
+from ..connections import default_pool
+from ..evalcache import default_eval_cache
+from ..github import GithubClient, PullRequest
+from ..history import default_history, format_duration
+from ..httpcache import default_http_cache
+from ..nix import Attr
+from ..pipeline import Stage, run_pipeline
+from ..review import (
+    CheckoutOption,
+    Review,
+    build_options,
+    build_reviews,
+    fetch_pull_requests,
+    log_options,
+)
+from ..ratelimit import RequestStats
+from ..utils import info, warn
+from ..worktree import default_worktree_pool
 from .utils import ensure_github_token
 
 
@@ -31,6 +47,97 @@ def parse_pr_numbers(number_args: List[str]) -> List[int]:
     return prs
 
 
+def prefetch_pull_requests(
+    prs: List[int], args: argparse.Namespace
+) -> Tuple[Dict[int, PullRequest], Dict[int, Tuple[str, str]]]:
+    """
+    Fetches all pull requests and their ofborg evaluations concurrently and
+    then their commits with one git fetch instead of one per pull request
+    """
+    if args.resume:
+        # resumed reviews do not fetch anything
+        return {}, {}
+    github_client = GithubClient(args.token, cache=default_http_cache())
+    pulls = github_client.fetch_pull_requests(prs, args.eval == "ofborg")
+    try:
+        revs = fetch_pull_requests(
+            "https://github.com/NixOS/nixpkgs", [p.data for p in pulls.values()]
+        )
+    except subprocess.CalledProcessError:
+        warn("Fetching all pull requests at once failed, fetching them one by one")
+        return pulls, {}
+    return pulls, revs
+
+
+Context = Tuple[Review, int, List[Attr]]
+
+
+def print_request_stats(stats: RequestStats) -> None:
+    info(
+        f"GitHub API: {stats.requests} requests, {stats.cache_hits} unchanged "
+        f"since the last review, {stats.retries} retried, "
+        f"{format_duration(stats.wait_time)} waited for the rate limit"
+    )
+
+
+def review_sequentially(
+    reviews: List[Tuple[int, Review]],
+    pulls: Dict[int, PullRequest],
+    revs: Dict[int, Tuple[str, str]],
+) -> List[Context]:
+    contexts = []
+    for pr, review in reviews:
+        try:
+            attrs = review.build_pr(pr, pulls.get(pr), revs.get(pr))
+            contexts.append((review, pr, attrs))
+        except subprocess.CalledProcessError:
+            warn(f"https://github.com/NixOS/nixpkgs/pull/{pr} failed to build")
+    return contexts
+
+
+def review_pipelined(
+    args: argparse.Namespace,
+    reviews: List[Tuple[int, Review]],
+    pulls: Dict[int, PullRequest],
+    revs: Dict[int, Tuple[str, str]],
+    union: bool = False,
+) -> List[Context]:
+    """
+    Fetches and evaluates the next pull requests while the current one builds.
+    With `union` all pull requests are evaluated first and then built at once.
+    """
+    attrs: Dict[int, List[Attr]] = {}
+
+    def fetch(item: Tuple[int, Review]) -> None:
+        pr, review = item
+        review.fetch_pr(pr, pulls.get(pr), revs.get(pr))
+
+    def evaluate(item: Tuple[int, Review]) -> None:
+        pr, review = item
+        attrs[pr] = review.evaluate_pr()
+
+    def build(item: Tuple[int, Review]) -> None:
+        item[1].build_pending()
+
+    stages = [
+        Stage("fetch", args.fetch_jobs, fetch),
+        Stage("evaluate", args.eval_jobs, evaluate),
+    ]
+    if not union:
+        stages.append(Stage("build", args.build_jobs, build))
+    errors = run_pipeline(reviews, stages)
+    contexts = []
+    for index, (pr, review) in enumerate(reviews):
+        error = errors.get(index)
+        if error is None:
+            contexts.append((review, pr, attrs[pr]))
+        else:
+            warn(f"https://github.com/NixOS/nixpkgs/pull/{pr} failed: {error}")
+    if union:
+        build_reviews([review for review, _, _ in contexts])
+    return contexts
+
+
 def pr_command(args: argparse.Namespace) -> None:
     prs = parse_pr_numbers(args.number)
     use_ofborg_eval = args.eval == "ofborg"
@@ -41,30 +148,58 @@ def pr_command(args: argparse.Namespace) -> None:
     if args.post_result:
         ensure_github_token(args.token)
 
-    contexts = []
+    # incremental evaluation relies on the dependency index stored in the cache
+    eval_cache = (
+        default_eval_cache() if args.eval_cache or args.eval_incremental else None
+    )
+    # a plan estimates build times from the history
+    history = default_history() if args.history or args.plan else None
+    worktree_pool = default_worktree_pool() if args.worktree_pool else None
+    pulls, revs = prefetch_pull_requests(prs, args) if len(prs) > 1 else ({}, {})
 
     with Buildenv(), ExitStack() as stack:
+        reviews = []
         for pr in prs:
-            builddir = stack.enter_context(Builddir(f"pr-{pr}"))
-            try:
-                review = Review(
-                    builddir=builddir,
-                    build_args=args.build_args,
-                    no_shell=args.no_shell,
-                    api_token=args.token,
-                    use_ofborg_eval=use_ofborg_eval,
-                    only_packages=set(args.package),
-                    package_regexes=args.package_regex,
-                    skip_packages=set(args.skip_package),
-                    skip_packages_regex=args.skip_package_regex,
-                    checkout=checkout_option,
-                )
-                contexts.append((pr, builddir.path, review.build_pr(pr)))
-            except subprocess.CalledProcessError:
-                warn(f"https://github.com/NixOS/nixpkgs/pull/{pr} failed to build")
-
-        for pr, path, attrs in contexts:
-            review.start_review(attrs, path, pr, args.post_result)
+            builddir = stack.enter_context(
+                Builddir(f"pr-{pr}", resume=args.resume, worktree_pool=worktree_pool)
+            )
+            review = Review(
+                builddir=builddir,
+                build_args=args.build_args,
+                no_shell=args.no_shell,
+                api_token=args.token,
+                use_ofborg_eval=use_ofborg_eval,
+                only_packages=set(args.package),
+                package_regexes=args.package_regex,
+                skip_packages=set(args.skip_package),
+                skip_packages_regex=args.skip_package_regex,
+                checkout=checkout_option,
+                eval_parallel=args.eval_parallel,
+                eval_cache=eval_cache,
+                eval_shards=args.eval_shards,
+                eval_memory_limit=args.eval_memory_limit,
+                eval_incremental=args.eval_incremental,
+                eval_workers=args.eval_workers,
+                log_options=log_options(args),
+                history=history,
+                plan=args.plan,
+                build_options=build_options(args),
+                resume=args.resume,
+            )
+            reviews.append((pr, review))
+
+        if args.union_build and len(prs) > 1:
+            contexts = review_pipelined(args, reviews, pulls, revs, union=True)
+        elif args.pipeline and len(prs) > 1:
+            contexts = review_pipelined(args, reviews, pulls, revs)
+        else:
+            contexts = review_sequentially(reviews, pulls, revs)
+
+        if len(prs) > 1:
+            print_request_stats(default_pool.scheduler.stats)
+
+        for review, pr, attrs in contexts:
+            review.start_review(attrs, review.builddir.path, pr, args.post_result)
 
         if len(contexts) != len(prs):
             sys.exit(1)
@@ -0,0 +1,232 @@
+import base64
+import gzip
+import http.client
+import io
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+from .httpcache import CachedResponse, HttpCache
+from .ratelimit import IDEMPOTENT_METHODS, RequestScheduler
+from .utils import warn
+
+# idle connections kept open per host
+MAX_IDLE_CONNECTIONS = 4
+MAX_REDIRECTS = 5
+TIMEOUT = 60
+
+# a connection that was idle in the pool may have been closed by the server
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+Host = Tuple[str, str]
+
+
+class ConnectionPool:
+    """
+    Keeps HTTP/1.1 connections open between requests, so that requests to the
+    same host do not pay for a new TCP connection and TLS handshake each time
+    """
+
+    def __init__(
+        self,
+        max_idle: int = MAX_IDLE_CONNECTIONS,
+        scheduler: Optional[RequestScheduler] = None,
+        proxies: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.max_idle = max_idle
+        self.scheduler = RequestScheduler() if scheduler is None else scheduler
+        # like urlopen, from the http_proxy and https_proxy variables
+        self.proxies = urllib.request.getproxies() if proxies is None else proxies
+        self.idle: Dict[Host, List[http.client.HTTPConnection]] = {}
+        self.lock = threading.Lock()
+        # number of connections opened, i.e. handshakes made
+        self.connections = 0
+
+    def _proxy(self, host: Host) -> Optional[urllib.parse.SplitResult]:
+        scheme, netloc = host
+        proxy = self.proxies.get(scheme)
+        if not proxy or urllib.request.proxy_bypass(netloc.rsplit(":", 1)[0]):
+            return None
+        if "://" not in proxy:
+            proxy = f"http://{proxy}"
+        return urllib.parse.urlsplit(proxy)
+
+    def _proxy_headers(self, proxy: urllib.parse.SplitResult) -> Dict[str, str]:
+        if proxy.username is None:
+            return {}
+        username = urllib.parse.unquote(proxy.username)
+        password = urllib.parse.unquote(proxy.password or "")
+        credentials = f"{username}:{password}"
+        token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+        return {"Proxy-Authorization": f"Basic {token}"}
+
+    def _connect(self, host: Host, reuse: bool = True) -> http.client.HTTPConnection:
+        scheme, netloc = host
+        with self.lock:
+            idle = self.idle.get(host)
+            if idle and reuse:
+                return idle.pop()
+            self.connections += 1
+        proxy = self._proxy(host)
+        if proxy is None:
+            if scheme == "https":
+                return http.client.HTTPSConnection(netloc, timeout=TIMEOUT)
+            return http.client.HTTPConnection(netloc, timeout=TIMEOUT)
+        address = proxy.hostname or "", proxy.port or 80
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(*address, timeout=TIMEOUT)
+            conn.set_tunnel(netloc, headers=self._proxy_headers(proxy))
+            return conn
+        return http.client.HTTPConnection(*address, timeout=TIMEOUT)
+
+    def _release(self, host: Host, conn: http.client.HTTPConnection) -> None:
+        with self.lock:
+            idle = self.idle.setdefault(host, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(
+        self,
+        host: Host,
+        method: str,
+        target: str,
+        headers: Dict[str, str],
+        body: Optional[bytes],
+    ) -> Tuple[http.client.HTTPResponse, bytes]:
+        # the server may have processed a request before closing the
+        # connection, so only idempotent ones are sent again. A POST could
+        # post a comment twice and gets a new connection, which is not stale.
+        idempotent = method in IDEMPOTENT_METHODS
+        proxy = self._proxy(host)
+        if proxy is not None and host[0] == "http":
+            # plain http proxies get the absolute url instead of a tunnel
+            target = f"http://{host[1]}{target}"
+            headers = {**headers, **self._proxy_headers(proxy)}
+        while True:
+            conn = self._connect(host, reuse=idempotent)
+            reused = conn.sock is not None
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                if resp.getheader("Content-Encoding") == "gzip":
+                    data = gzip.decompress(data)
+            except STALE_CONNECTION_ERRORS as e:
+                conn.close()
+                if reused and idempotent:
+                    continue
+                raise urllib.error.URLError(e) from e
+            except OSError as e:
+                # like urlopen
+                conn.close()
+                raise urllib.error.URLError(e) from e
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(host, conn)
+            return resp, data
+
+    def _send_scheduled(
+        self,
+        host: Host,
+        method: str,
+        target: str,
+        headers: Dict[str, str],
+        body: Optional[bytes],
+    ) -> Tuple[http.client.HTTPResponse, bytes]:
+        limit = (host[1], headers.get("Authorization", ""))
+        attempt = 0
+        while True:
+            self.scheduler.wait(limit)
+            try:
+                resp, data = self._send(host, method, target, headers, body)
+            except urllib.error.URLError as e:
+                error_delay = self.scheduler.error_retry_delay(method, attempt)
+                if error_delay is None:
+                    raise
+                attempt += 1
+                warn(
+                    f"{method} {host[1]}{target} failed with {e.reason}, "
+                    f"retrying in {error_delay:.0f}s"
+                )
+                self.scheduler.sleep(error_delay)
+                continue
+            self.scheduler.update(limit, resp)
+            delay = self.scheduler.retry_delay(method, resp, data, attempt)
+            if delay is None:
+                return resp, data
+            attempt += 1
+            warn(
+                f"{method} {host[1]}{target} failed with {resp.status} {resp.reason}, "
+                f"retrying in {delay:.0f}s"
+            )
+            self.scheduler.sleep(delay)
+
+    def request(
+        self,
+        url: str,
+        method: str = "GET",
+        headers: Dict[str, str] = {},
+        body: Optional[bytes] = None,
+        cache: Optional[HttpCache] = None,
+    ) -> bytes:
+        """
+        Returns the decoded body of the response. Like `urllib.request.urlopen`
+        redirects are followed, error responses raise
+        `urllib.error.HTTPError` and connection errors `urllib.error.URLError`,
+        and the http_proxy and https_proxy variables are honoured. GET requests are revalidated against `cache`.
+        """
+        headers = dict(headers)
+        headers["Accept-Encoding"] = "gzip"
+        key = None
+        cached = None
+        if cache is not None and method == "GET":
+            key = cache.key(url, headers)
+            cached = cache.get(key)
+            if cached is not None:
+                headers.update(cached.validators())
+        for _ in range(MAX_REDIRECTS + 1):
+            parsed = urllib.parse.urlsplit(url)
+            target = urllib.parse.urlunsplit(
+                ("", "", parsed.path or "/", parsed.query, "")
+            )
+            resp, data = self._send_scheduled(
+                (parsed.scheme, parsed.netloc), method, target, headers, body
+            )
+            location = resp.getheader("Location")
+            if resp.status in (301, 302, 303, 307, 308) and location is not None:
+                url = urllib.parse.urljoin(url, location)
+                if resp.status == 303:
+                    method, body = "GET", None
+                continue
+            if resp.status == 304 and cached is not None:
+                with self.scheduler.lock:
+                    self.scheduler.stats.cache_hits += 1
+                return cached.body
+            if resp.status >= 400:
+                raise urllib.error.HTTPError(
+                    url, resp.status, resp.reason, resp.headers, io.BytesIO(data)
+                )
+            etag = resp.getheader("ETag")
+            last_modified = resp.getheader("Last-Modified")
+            if cache is not None and key is not None and (etag or last_modified):
+                cache.put(key, CachedResponse(data, etag, last_modified))
+            return data
+        raise urllib.error.HTTPError(
+            url, resp.status, "Too many redirects", resp.headers, None
+        )
+
+
+# shared by all `GithubClient`s of a process
+default_pool = ConnectionPool()
@@ -0,0 +1,105 @@
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from .utils import cache_home
+
+# nixpkgs listings compress to a few megabytes each
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+class EvalCache:
+    """
+    Persistent key-value store for evaluation results. Entries are evicted in
+    least-recently-used order once the cache exceeds `max_size` bytes.
+    """
+
+    def __init__(self, path: Path, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.path = path
+        self.max_size = max_size
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                  key TEXT PRIMARY KEY,
+                  data BLOB NOT NULL,
+                  size INTEGER NOT NULL,
+                  last_used REAL NOT NULL
+                )""")
+
+    def _connect(self) -> sqlite3.Connection:
+        # A new connection per operation, so that the cache can be used from
+        # worker threads and by concurrent nixpkgs-review processes.
+        return sqlite3.connect(str(self.path), timeout=60)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with closing(self._connect()) as db, db:
+            row = db.execute(
+                "SELECT data FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            data: bytes = row[0]
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._evict(db)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(keys)
+        found: Dict[str, bytes] = {}
+        with closing(self._connect()) as db, db:
+            now = time.time()
+            # stay below sqlite's limit of host parameters per statement
+            for start in range(0, len(keys), 500):
+                end = start + 500
+                batch = keys[start:end]
+                placeholders = ",".join("?" * len(batch))
+                rows = db.execute(
+                    f"SELECT key, data FROM entries WHERE key IN ({placeholders})",
+                    batch,
+                )
+                found.update(rows)
+                db.execute(
+                    f"UPDATE entries SET last_used = ? WHERE key IN ({placeholders})",
+                    (now, *batch),
+                )
+        return found
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            db.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                ((key, data, len(data), now) for key, data in items.items()),
+            )
+            self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = db.execute("SELECT key, size FROM entries ORDER BY last_used DESC")
+        kept = 0
+        evicted = []
+        for key, size in rows:
+            kept += size
+            if kept > self.max_size:
+                evicted.append((key,))
+        db.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+
+def default_eval_cache() -> Optional[EvalCache]:
+    directory = cache_home()
+    if directory is None:
+        return None
+    return EvalCache(directory.joinpath("eval-cache.sqlite"))
@@ -1,17 +1,41 @@
 import json
 import urllib.parse
-import urllib.request
 from collections import defaultdict
-from typing import Any, DefaultDict, Dict, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, DefaultDict, Dict, List, Optional, Set
+
+from .connections import ConnectionPool, default_pool
+from .httpcache import HttpCache
+from .utils import warn
 
 
 def pr_url(pr: int) -> str:
     return f"https://github.com/NixOS/nixpkgs/pull/{pr}"
 
 
+# github penalizes too many concurrent requests with its secondary rate limit
+MAX_CONCURRENT_REQUESTS = 4
+
+
+@dataclass
+class PullRequest:
+    data: Dict[str, Any]
+    # packages per system evaluated by ofborg, None if its evaluation was not
+    # fetched or not found
+    borg_eval: Optional[Dict[str, Set[str]]] = None
+
+
 class GithubClient:
-    def __init__(self, api_token: Optional[str]) -> None:
+    def __init__(
+        self,
+        api_token: Optional[str],
+        pool: ConnectionPool = default_pool,
+        cache: Optional[HttpCache] = None,
+    ) -> None:
         self.api_token = api_token
+        self.pool = pool
+        self.cache = cache
 
     def _request(
         self, path: str, method: str, data: Optional[Dict[str, Any]] = None
@@ -25,9 +49,7 @@ class GithubClient:
         if data:
             body = json.dumps(data).encode("ascii")
 
-        req = urllib.request.Request(url, headers=headers, method=method, data=body)
-        resp = urllib.request.urlopen(req)
-        return json.loads(resp.read())
+        return json.loads(self.pool.request(url, method, headers, body, self.cache))
 
     def get(self, path: str) -> Any:
         return self._request(path, "GET")
@@ -83,10 +105,42 @@ class GithubClient:
                 raw_gist_url = (
                     f"https://gist.githubusercontent.com/GrahamcOfBorg{url.path}/raw/"
                 )
-                for line in urllib.request.urlopen(raw_gist_url):
+                gist = self.pool.request(raw_gist_url, cache=self.cache)
+                for line in gist.splitlines():
                     if line == b"":
                         break
                     system, attribute = line.decode("utf-8").split()
                     packages_per_system[system].add(attribute)
                 return packages_per_system
         return None
+
+    def fetch_pull_request(self, number: int, borg_eval: bool) -> PullRequest:
+        "Get a pull request and, if `borg_eval` is set, the evaluation of ofborg"
+        pr = self.pull_request(number)
+        return PullRequest(pr, self.get_borg_eval_gist(pr) if borg_eval else None)
+
+    def fetch_pull_requests(
+        self,
+        numbers: List[int],
+        borg_eval: bool,
+        jobs: int = MAX_CONCURRENT_REQUESTS,
+    ) -> Dict[int, PullRequest]:
+        """
+        Like `fetch_pull_request` for multiple pull requests, which are
+        fetched concurrently. Pull requests that could not be fetched are
+        left out and fetched again when they are reviewed.
+        """
+
+        def fetch(number: int) -> Optional[PullRequest]:
+            try:
+                return self.fetch_pull_request(number, borg_eval)
+            except OSError as e:
+                # includes urllib.error.URLError and connection errors
+                warn(f"Prefetching pull request #{number} failed: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            pulls = executor.map(fetch, numbers)
+            return {
+                number: pull for number, pull in zip(numbers, pulls) if pull is not None
+            }
@@ -0,0 +1,206 @@
+import sqlite3
+import statistics
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .nix import Attr
+from .report import Report
+from .utils import cache_home
+
+
+@dataclass
+class Run:
+    # "pr", "rev" or "wip"
+    kind: str
+    # pull request number, commit or the base branch of a wip review
+    target: str
+    system: str
+    started: float
+    # seconds spent in each phase of the review, see `Review.phase`
+    phases: Dict[str, float] = field(default_factory=dict)
+    id: Optional[int] = None
+    built: int = 0
+    failed: int = 0
+
+
+@dataclass
+class BuildRecord:
+    run: Run
+    attr: str
+    drv_path: Optional[str]
+    outcome: str
+    build_time: Optional[float]
+    substituted: bool
+
+
+def outcomes(report: Report) -> Dict[str, List[Attr]]:
+    return {
+        "broken": report.broken,
+        "blacklisted": report.blacklisted,
+        "missing": report.non_existant,
+        "test": report.tests,
+        "failed": report.failed,
+        "skipped": report.skipped,
+        "built": report.built,
+    }
+
+
+class History:
+    """
+    Records every review run together with the outcome and build time of each
+    attribute in a sqlite database
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("""CREATE TABLE IF NOT EXISTS runs (
+                  id INTEGER PRIMARY KEY,
+                  kind TEXT NOT NULL,
+                  target TEXT NOT NULL,
+                  system TEXT NOT NULL,
+                  started REAL NOT NULL
+                )""")
+            db.execute("""CREATE TABLE IF NOT EXISTS phases (
+                  run INTEGER NOT NULL REFERENCES runs(id),
+                  name TEXT NOT NULL,
+                  duration REAL NOT NULL
+                )""")
+            db.execute("""CREATE TABLE IF NOT EXISTS builds (
+                  run INTEGER NOT NULL REFERENCES runs(id),
+                  attr TEXT NOT NULL,
+                  drv_path TEXT,
+                  outcome TEXT NOT NULL,
+                  build_time REAL,
+                  substituted INTEGER NOT NULL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS builds_attr ON builds (attr)")
+            # counted per run in `runs`
+            db.execute("CREATE INDEX IF NOT EXISTS builds_run ON builds (run)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=60)
+
+    def record(self, run: Run, report: Report) -> int:
+        with closing(self._connect()) as db, db:
+            cursor = db.execute(
+                "INSERT INTO runs (kind, target, system, started) VALUES (?, ?, ?, ?)",
+                (run.kind, run.target, run.system, run.started),
+            )
+            assert cursor.lastrowid is not None
+            run_id: int = cursor.lastrowid
+            db.executemany(
+                "INSERT INTO phases VALUES (?, ?, ?)",
+                ((run_id, name, duration) for name, duration in run.phases.items()),
+            )
+            db.executemany(
+                "INSERT INTO builds VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        run_id,
+                        attr.name,
+                        attr.drv_path,
+                        outcome,
+                        attr.build_time,
+                        int(attr.substituted),
+                    )
+                    for outcome, attrs in outcomes(report).items()
+                    for attr in attrs
+                ),
+            )
+        run.id = run_id
+        return run_id
+
+    def _phases(self, db: sqlite3.Connection, run: Run) -> None:
+        rows = db.execute("SELECT name, duration FROM phases WHERE run = ?", (run.id,))
+        run.phases = dict(rows)
+
+    def runs(self, limit: int = 20) -> List[Run]:
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                """SELECT id, kind, target, system, started,
+                     (SELECT COUNT(*) FROM builds WHERE run = id AND outcome = 'built'),
+                     (SELECT COUNT(*) FROM builds WHERE run = id AND outcome = 'failed')
+                   FROM runs ORDER BY started DESC LIMIT ?""",
+                (limit,),
+            ).fetchall()
+            runs = []
+            for id, kind, target, system, started, built, failed in rows:
+                run = Run(
+                    kind, target, system, started, id=id, built=built, failed=failed
+                )
+                self._phases(db, run)
+                runs.append(run)
+        return runs
+
+    def builds(self, attr: str, limit: int = 20) -> List[BuildRecord]:
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                """SELECT runs.id, kind, target, system, started,
+                     attr, drv_path, outcome, build_time, substituted
+                   FROM builds JOIN runs ON builds.run = runs.id
+                   WHERE attr = ? ORDER BY started DESC LIMIT ?""",
+                (attr, limit),
+            ).fetchall()
+        records = []
+        for id, kind, target, system, started, *build in rows:
+            run = Run(kind, target, system, started, id=id)
+            name, drv_path, outcome, build_time, substituted = build
+            records.append(
+                BuildRecord(run, name, drv_path, outcome, build_time, substituted != 0)
+            )
+        return records
+
+    def build_times(self, attrs: Iterable[str], samples: int = 5) -> Dict[str, float]:
+        """
+        Median of the last `samples` local builds of each attribute that
+        succeeded, attributes that were never built are left out
+        """
+        names = list(attrs)
+        times: Dict[str, List[float]] = {}
+        with closing(self._connect()) as db:
+            # stay below sqlite's limit of host parameters per statement
+            for start in range(0, len(names), 500):
+                end = start + 500
+                batch = names[start:end]
+                placeholders = ",".join("?" * len(batch))
+                rows = db.execute(
+                    f"""SELECT attr, build_time
+                       FROM builds JOIN runs ON builds.run = runs.id
+                       WHERE attr IN ({placeholders}) AND outcome = 'built'
+                         AND substituted = 0 AND build_time IS NOT NULL
+                       ORDER BY started DESC""",
+                    batch,
+                )
+                for name, build_time in rows:
+                    previous = times.setdefault(name, [])
+                    if len(previous) < samples:
+                        previous.append(build_time)
+        return {name: statistics.median(values) for name, values in times.items()}
+
+
+def default_history() -> Optional[History]:
+    directory = cache_home()
+    if directory is None:
+        return None
+    return History(directory.joinpath("history.sqlite"))
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02}m"
+    if minutes:
+        return f"{minutes}m{secs:02}s"
+    return f"{secs}s"
+
+
+def format_time(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
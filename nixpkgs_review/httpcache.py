@@ -0,0 +1,68 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from .evalcache import EvalCache
+from .utils import cache_home
+
+# API responses are small, pull requests with their statuses are a few
+# kilobytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """
+    Persistent cache of GET responses with their ETag and Last-Modified
+    headers. Cached responses are revalidated with conditional requests, which
+    GitHub answers with 304 Not Modified if nothing changed. These do not
+    count against the rate limit.
+    """
+
+    def __init__(self, store: EvalCache) -> None:
+        self.store = store
+
+    def key(self, url: str, headers: Dict[str, str]) -> str:
+        # what a token is allowed to see differs, but the token itself must
+        # not end up in the cache
+        token = headers.get("Authorization", "")
+        identity = hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+        return f"{identity} {url}"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        data = self.store.get(key)
+        if data is None:
+            return None
+        header, _, body = data.partition(b"\n")
+        validators = json.loads(header)
+        return CachedResponse(body, validators["etag"], validators["last_modified"])
+
+    def put(self, key: str, response: CachedResponse) -> None:
+        header = json.dumps(
+            dict(etag=response.etag, last_modified=response.last_modified)
+        )
+        self.store.put(key, header.encode("utf-8") + b"\n" + response.body)
+
+
+def default_http_cache() -> Optional[HttpCache]:
+    directory = cache_home()
+    if directory is None:
+        return None
+    return HttpCache(
+        EvalCache(directory.joinpath("github-cache.sqlite"), DEFAULT_MAX_SIZE)
+    )
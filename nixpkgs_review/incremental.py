@@ -0,0 +1,165 @@
+import json
+import os
+import subprocess
+import zlib
+from collections import defaultdict
+from typing import DefaultDict, Dict, Iterable, List, Optional, Set, Tuple
+
+from .utils import info, warn
+
+# Changes below these directories can affect every package in nixpkgs.
+FULL_EVAL_PREFIXES = (
+    "lib/",
+    "nixos/",
+    "pkgs/build-support/",
+    "pkgs/pkgs-lib/",
+    "pkgs/stdenv/",
+    "pkgs/top-level/",
+)
+
+# Evaluating a subset of nixpkgs is slower per attribute than evaluating all
+# of it, so large subsets are not worth it.
+MAX_INCREMENTAL_ATTRS = 2000
+
+# attribute path, directory of the package's position, derivation path
+IndexEntry = Tuple[str, Optional[str], Optional[str]]
+
+
+class DependencyIndex:
+    """
+    Maps files of a nixpkgs tree to the attributes defined in them and
+    derivations back to their attributes. Built from one full evaluation of
+    the base tree with `--meta --drv-path`.
+    """
+
+    def __init__(self, entries: List[IndexEntry]) -> None:
+        self.entries = entries
+        self.attrs_by_dir: DefaultDict[str, Set[str]] = defaultdict(set)
+        self.attrs_by_drv: DefaultDict[str, Set[str]] = defaultdict(set)
+        self.drv_by_attr: Dict[str, str] = {}
+        for attr, position_dir, drv_path in entries:
+            if position_dir is not None:
+                self.attrs_by_dir[position_dir].add(attr)
+            if drv_path is not None:
+                self.attrs_by_drv[drv_path].add(attr)
+                self.drv_by_attr[attr] = drv_path
+
+    @staticmethod
+    def build(
+        root: str, packages: Iterable[Tuple[str, Optional[str], Optional[str]]]
+    ) -> "DependencyIndex":
+        """
+        Build the index from `(attr_path, position, drv_path)` of all packages
+        evaluated in the nixpkgs checkout at `root`
+        """
+        # nix reports positions with symlinks resolved, i.e. the worktree of
+        # a `WorktreePool` linked into the build directory
+        roots = [os.path.realpath(root), root.rstrip("/")]
+        entries: List[IndexEntry] = []
+        for attr, position, drv_path in packages:
+            position_dir = None
+            # positions look like /path/to/nixpkgs/pkgs/foo/default.nix:12
+            for checkout in roots:
+                if position is not None and position.startswith(checkout + "/"):
+                    file = position.rsplit(":", 1)[0]
+                    position_dir = os.path.dirname(os.path.relpath(file, checkout))
+                    break
+            entries.append((attr, position_dir, drv_path))
+        return DependencyIndex(entries)
+
+    def encode(self) -> bytes:
+        return zlib.compress(json.dumps(self.entries).encode("utf-8"))
+
+    @staticmethod
+    def decode(data: bytes) -> "DependencyIndex":
+        entries: List[IndexEntry] = [
+            (attr, position_dir, drv_path)
+            for attr, position_dir, drv_path in json.loads(zlib.decompress(data))
+        ]
+        return DependencyIndex(entries)
+
+    def file_attrs(self, file: str) -> Optional[Set[str]]:
+        """
+        Attributes that are defined next to `file` or below its directory.
+        Returns None if the file cannot be attributed to single packages.
+        """
+        if "/" not in file or file.startswith(FULL_EVAL_PREFIXES):
+            return None
+
+        parts = file.split("/")
+        if parts[:2] == ["pkgs", "by-name"] and len(parts) > 4:
+            # pkgs/by-name/xx/name/package.nix defines the attribute `name`
+            return {parts[3]} | self.attrs_by_dir.get("/".join(parts[:4]), set())
+
+        directory = os.path.dirname(file)
+        attrs: Set[str] = set()
+        for position_dir, dir_attrs in self.attrs_by_dir.items():
+            if position_dir == directory or position_dir.startswith(directory + "/"):
+                attrs |= dir_attrs
+        # files in sub directories of a package, i.e. patches
+        while not attrs and directory.count("/") >= 2:
+            directory = os.path.dirname(directory)
+            attrs |= self.attrs_by_dir.get(directory, set())
+        if not attrs:
+            return None
+        return attrs
+
+    def reverse_dependencies(self, attrs: Set[str]) -> Optional[Set[str]]:
+        """
+        Attributes whose derivations depend on one of `attrs`. Relies on the
+        derivations of the indexed evaluation still being in the nix store.
+        """
+        drvs = sorted(self.drv_by_attr[a] for a in attrs if a in self.drv_by_attr)
+        if not drvs:
+            return set()
+        proc = subprocess.run(
+            ["nix-store", "--query", "--referrers-closure"] + drvs,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        if proc.returncode != 0:
+            warn("Derivations of the dependency index were garbage collected")
+            return None
+        dependents: Set[str] = set()
+        for drv in proc.stdout.split():
+            dependents |= self.attrs_by_drv.get(drv, set())
+        return dependents
+
+    def affected_attrs(self, files: List[str]) -> Optional[Set[str]]:
+        """
+        Attributes that a change of `files` may affect, or None if nixpkgs has
+        to be evaluated completely
+        """
+        candidates: Set[str] = set()
+        for file in files:
+            attrs = self.file_attrs(file)
+            if attrs is None:
+                info(f"{file} may affect any package, evaluating everything")
+                return None
+            candidates |= attrs
+        dependents = self.reverse_dependencies(candidates)
+        if dependents is None:
+            return None
+        affected = candidates | dependents
+        if len(affected) > MAX_INCREMENTAL_ATTRS:
+            info(f"{len(affected)} packages affected, evaluating everything")
+            return None
+        return affected
+
+
+def changed_files(
+    base_commit: str, reviewed_commit: Optional[str], staged: bool = False
+) -> List[str]:
+    """
+    Files changed by the reviewed commit or by the uncommitted changes in the
+    current git repository
+    """
+    cmd = ["git", "diff", "--name-only"]
+    if reviewed_commit is None:
+        cmd.extend(["--staged"] if staged else [])
+    else:
+        # only the changes of the reviewed commit, not those of the base
+        cmd.append(f"{base_commit}...{reviewed_commit}")
+    proc = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True)
+    return proc.stdout.split()
@@ -1,13 +1,18 @@
 import json
+import math
 import os
 import shlex
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from .utils import ROOT, escape_attr, info, sh, warn
+from .evalcache import EvalCache
+from .progress import BuildProgress
+from .schedule import build_tiers
+from .utils import ROOT, escape_attr, info, memory_limit_command, sh, warn
 
 
 @dataclass
@@ -20,6 +25,11 @@ class Attr:
     drv_path: Optional[str]
     aliases: List[str] = field(default_factory=lambda: [])
     _path_verified: Optional[bool] = field(init=False, default=None)
+    # seconds spent building or substituting, see `BuildProgress`
+    build_time: Optional[float] = field(init=False, default=None)
+    substituted: bool = field(init=False, default=False)
+    # not built because the build was aborted, see `BuildOptions`
+    skipped: bool = field(init=False, default=False)
 
     def was_build(self) -> bool:
         if self.path is None:
@@ -38,6 +48,54 @@ class Attr:
         return self.name.startswith("nixosTests")
 
 
+# keep the command line of nix-store well below ARG_MAX
+VERIFY_BATCH_SIZE = 1000
+
+
+def invalid_paths(paths: List[str]) -> Optional[Set[str]]:
+    """
+    Returns which of `paths` are not valid in the nix store, with one
+    nix-store call per batch. Returns None if nix-store cannot check them.
+    """
+    invalid: Set[str] = set()
+    for start in range(0, len(paths), VERIFY_BATCH_SIZE):
+        end = start + VERIFY_BATCH_SIZE
+        batch = paths[start:end]
+        res = subprocess.run(
+            ["nix-store", "--check-validity", "--print-invalid"] + batch,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        if res.returncode != 0:
+            # i.e. paths outside of the nix store
+            return None
+        invalid.update(res.stdout.split())
+    return invalid
+
+
+def verify_paths(attrs: List[Attr]) -> None:
+    """
+    Check whether the outputs of all `attrs` were built with one nix-store
+    call per batch instead of one call per attribute (see `Attr.was_build`)
+    """
+    unverified = [a for a in attrs if a.path is not None and a._path_verified is None]
+    paths = sorted(set(a.path for a in unverified if a.path is not None))
+    invalid = invalid_paths(paths)
+    if invalid is None:
+        # was_build checks them one by one
+        return
+    for attr in unverified:
+        attr._path_verified = attr.path not in invalid
+
+
+def nix_version() -> str:
+    proc = subprocess.run(
+        ["nix", "--version"], check=True, stdout=subprocess.PIPE, text=True
+    )
+    return proc.stdout.strip()
+
+
 def nix_shell(attrs: List[str], cache_directory: Path) -> None:
     shell = cache_directory.joinpath("shell.nix")
     write_shell_expression(shell, attrs)
@@ -75,11 +133,100 @@ def _nix_eval_filter(json: Dict[str, Any]) -> List[Attr]:
     return list(attr_by_path.values()) + broken
 
 
-def nix_eval(attrs: Set[str]) -> List[Attr]:
+class AttrCache:
+    """
+    Memoizes `nix eval` results per attribute. While `scope` identifies the
+    evaluated nixpkgs tree, results are also persisted in `store` and shared
+    between runs.
+    """
+
+    def __init__(self, store: Optional[EvalCache] = None) -> None:
+        self.store = store
+        self.scope: Optional[str] = None
+        self.memory: Dict[Tuple[Optional[str], str], Dict[str, Any]] = {}
+
+    def _key(self, name: str) -> str:
+        return f"{self.scope}:{name}"
+
+    def lookup(self, attrs: Set[str]) -> Dict[str, Dict[str, Any]]:
+        results: Dict[str, Dict[str, Any]] = {}
+        for name in attrs:
+            props = self.memory.get((self.scope, name))
+            if props is not None:
+                results[name] = props
+        missing = attrs - results.keys()
+        if self.store is None or self.scope is None or not missing:
+            return results
+        found = self.store.get_many(self._key(name) for name in missing)
+        stored: Dict[str, Dict[str, Any]] = {}
+        for name in missing:
+            data = found.get(self._key(name))
+            if data is not None:
+                stored[name] = json.loads(data)
+        # derivations of earlier runs may have been garbage collected since,
+        # building them would fail
+        drv_paths = sorted(set(p["drvPath"] for p in stored.values() if p["drvPath"]))
+        collected = invalid_paths(drv_paths) if drv_paths else set()
+        for name, props in stored.items():
+            if collected is None or props["drvPath"] in collected:
+                continue
+            self.memory[(self.scope, name)] = props
+            results[name] = props
+        return results
+
+    def update(self, results: Dict[str, Dict[str, Any]]) -> None:
+        for name, props in results.items():
+            self.memory[(self.scope, name)] = props
+        if self.store is not None and self.scope is not None:
+            self.store.put_many(
+                {
+                    self._key(name): json.dumps(props).encode("utf-8")
+                    for name, props in results.items()
+                }
+            )
+
+
+@dataclass
+class EvalOptions:
+    # number of `nix eval` processes for large attribute sets
+    workers: int = 1
+    # memory limit in MiB per `nix eval` process
+    memory_limit: Optional[int] = None
+    cache: Optional[AttrCache] = None
+    # NIX_PATH of the evaluated checkout, defaults to the environment
+    nix_path: Optional[str] = None
+
+
+@dataclass
+class BuildOptions:
+    # build derivations that others of the review depend on first
+    tiered: bool = False
+    # skip the remaining tiers once a derivation of an earlier tier failed
+    abort_on_tier_failure: bool = False
+    # stop building after this many derivations failed
+    max_failures: Optional[int] = None
+    # stop building once the failed derivations exceed this share of the
+    # attributes to build
+    max_failure_ratio: Optional[float] = None
+
+    def failure_budget_exceeded(self, failed: int, total: int) -> bool:
+        if self.max_failures is not None and failed >= self.max_failures:
+            return True
+        if self.max_failure_ratio is not None:
+            return failed > self.max_failure_ratio * total
+        return False
+
+
+# Each `nix eval` process has to load nixpkgs first, so splitting smaller sets
+# is not worth it
+MIN_EVAL_CHUNK_SIZE = 200
+
+
+def _nix_eval_chunk(attrs: List[str], options: EvalOptions) -> Dict[str, Any]:
     attr_json = NamedTemporaryFile(mode="w+", delete=False)
     delete = True
     try:
-        json.dump(list(attrs), attr_json)
+        json.dump(attrs, attr_json)
         eval_script = str(ROOT.joinpath("nix/evalAttrs.nix"))
         attr_json.flush()
         cmd = [
@@ -95,7 +242,15 @@ def nix_eval(attrs: Set[str]) -> List[Attr]:
 
         try:
             nix_eval = subprocess.run(
-                cmd, check=True, stdout=subprocess.PIPE, text=True
+                memory_limit_command(cmd, options.memory_limit),
+                check=True,
+                stdout=subprocess.PIPE,
+                text=True,
+                env=(
+                    None
+                    if options.nix_path is None
+                    else dict(os.environ, NIX_PATH=options.nix_path)
+                ),
             )
         except subprocess.CalledProcessError:
             warn(
@@ -104,29 +259,162 @@ def nix_eval(attrs: Set[str]) -> List[Attr]:
             delete = False
             raise
 
-        return _nix_eval_filter(json.loads(nix_eval.stdout))
+        result: Dict[str, Any] = json.loads(nix_eval.stdout)
+        return result
     finally:
         attr_json.close()
         if delete:
             os.unlink(attr_json.name)
 
 
-def nix_build(attr_names: Set[str], args: str, cache_directory: Path) -> List[Attr]:
-    if not attr_names:
-        info("Nothing to be built.")
-        return []
+def _nix_eval_attrs(attrs: Set[str], options: EvalOptions) -> Dict[str, Any]:
+    names = list(attrs)
+    if options.workers <= 1 or len(names) <= MIN_EVAL_CHUNK_SIZE:
+        return _nix_eval_chunk(names, options)
+
+    chunk_size = max(MIN_EVAL_CHUNK_SIZE, math.ceil(len(names) / options.workers))
+    count = math.ceil(len(names) / chunk_size)
+    chunks = [names[i::count] for i in range(count)]
+    info(f"Evaluate {len(names)} attributes in {len(chunks)} chunks")
+
+    results: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=options.workers) as executor:
+        for result in executor.map(
+            lambda chunk: _nix_eval_chunk(chunk, options), chunks
+        ):
+            results.update(result)
+    return results
+
+
+def nix_eval(attrs: Set[str], options: EvalOptions = EvalOptions()) -> List[Attr]:
+    if options.cache is None:
+        return _nix_eval_filter(_nix_eval_attrs(attrs, options))
+
+    results = options.cache.lookup(attrs)
+    missing = attrs - results.keys()
+    if len(results) > 0:
+        info(f"Using cached evaluation for {len(results)} of {len(attrs)} attributes")
+    if missing:
+        evaluated = _nix_eval_attrs(missing, options)
+        options.cache.update(evaluated)
+        results.update(evaluated)
+    return _nix_eval_filter({name: results[name] for name in sorted(results)})
 
-    attrs = nix_eval(attr_names)
+
+def build_attrs(
+    attrs: List[Attr],
+    args: str,
+    cache_directory: Path,
+    build_options: BuildOptions = BuildOptions(),
+    by_drv_path: bool = False,
+) -> None:
+    """
+    Builds evaluated attributes, see `nix_eval`. With `by_drv_path` their
+    derivations are built directly instead of the attributes of the nixpkgs
+    checkout in `cache_directory`.
+    """
     filtered = []
     for attr in attrs:
         if not (attr.broken or attr.blacklisted):
-            filtered.append(attr.name)
+            filtered.append(attr)
 
     if len(filtered) == 0:
-        return attrs
+        return
+    # attributes that share a derivation are built once
+    total = len(set(a.drv_path or a.name for a in filtered))
+
+    if build_options.tiered or build_options.abort_on_tier_failure:
+        tiers = tiered_attrs(filtered)
+    else:
+        tiers = [filtered]
+
+    progress = BuildProgress()
+    aborted = False
+    for i, tier in enumerate(tiers):
+        if len(tiers) > 1:
+            info(f"Build tier {i + 1}/{len(tiers)}: {len(tier)} packages")
+        aborted = not _nix_build_attrs(
+            tier, args, cache_directory, progress, build_options, total, by_drv_path
+        )
+        if aborted:
+            warn(f"Stopping the build after {progress.failed} failed derivations")
+            break
+        if not build_options.abort_on_tier_failure or i == len(tiers) - 1:
+            continue
+        verify_paths(tier)
+        failed = [a.name for a in tier if not a.was_build()]
+        if failed:
+            warn(f"{' '.join(failed)} failed to build, skipping the remaining tiers")
+            aborted = True
+            break
+    if aborted:
+        mark_skipped(filtered, progress)
+    # failed builds are detected in the report, see `verify_paths`
+    record_build_times(attrs, progress)
+
 
-    build = cache_directory.joinpath("build.nix")
-    write_shell_expression(build, filtered)
+def build_union(
+    attr_sets: List[List[Attr]],
+    args: str,
+    cache_directory: Path,
+    build_options: BuildOptions = BuildOptions(),
+) -> None:
+    """
+    Builds the attributes of several reviews with one nix build, so that
+    derivations they share are built once and nix schedules all of them
+    together. The attributes of each review are updated like by `build_attrs`.
+    """
+    attrs = [a for attrs in attr_sets for a in attrs]
+    drv_paths = set(
+        a.drv_path for a in attrs if a.drv_path and not (a.broken or a.blacklisted)
+    )
+    info(f"Build {len(drv_paths)} derivations of {len(attr_sets)} reviews at once")
+    build_attrs(attrs, args, cache_directory, build_options, by_drv_path=True)
+
+
+def mark_skipped(attrs: List[Attr], progress: BuildProgress) -> None:
+    verify_paths(attrs)
+    for attr in attrs:
+        if attr.was_build() or attr.drv_path is None:
+            continue
+        activity = progress.builds.get(attr.drv_path)
+        attr.skipped = activity is None or not activity.failed
+
+
+def tiered_attrs(attrs: List[Attr]) -> List[List[Attr]]:
+    by_drv: Dict[str, List[Attr]] = {}
+    for attr in attrs:
+        if attr.drv_path is not None:
+            by_drv.setdefault(attr.drv_path, []).append(attr)
+    tiers = [
+        [a for drv_path in tier for a in by_drv[drv_path]]
+        for tier in build_tiers(sorted(by_drv))
+    ]
+    unknown = [a for a in attrs if a.drv_path is None]
+    if unknown:
+        tiers.append(unknown)
+    return tiers
+
+
+def _nix_build_attrs(
+    attrs: List[Attr],
+    args: str,
+    cache_directory: Path,
+    progress: BuildProgress,
+    build_options: BuildOptions,
+    total: int,
+    by_drv_path: bool,
+) -> bool:
+    """
+    Returns False if the build was stopped because of too many failures
+    """
+    if by_drv_path:
+        # `^*` selects all outputs of a derivation
+        installables = sorted(set(f"{a.drv_path}^*" for a in attrs if a.drv_path))
+    else:
+        build = cache_directory.joinpath("build.nix")
+        write_shell_expression(build, [a.name for a in attrs])
+        installables = ["-f", str(build)]
 
     command = [
         "nix",
@@ -139,15 +427,34 @@ def nix_build(attr_names: Set[str], args: str, cache_directory: Path) -> List[At
         "--option",
         "build-use-sandbox",
         "relaxed",
-        "-f",
-        str(build),
-    ] + shlex.split(args)
+        "--log-format",
+        "internal-json",
+    ]
+    command += installables + shlex.split(args)
 
-    try:
-        sh(command)
-    except subprocess.CalledProcessError:
-        pass
-    return attrs
+    info("$ " + " ".join(command))
+    with subprocess.Popen(
+        command, stderr=subprocess.PIPE, text=True, errors="replace"
+    ) as proc:
+        assert proc.stderr
+        for line in proc.stderr:
+            progress.feed(line)
+            if build_options.failure_budget_exceeded(progress.failed, total):
+                proc.terminate()
+                return False
+    return True
+
+
+def record_build_times(attrs: List[Attr], progress: BuildProgress) -> None:
+    for attr in attrs:
+        activity = None
+        if attr.drv_path is not None:
+            activity = progress.builds.get(attr.drv_path)
+        if activity is None and attr.path is not None:
+            activity = progress.substitutions.get(attr.path)
+        if activity is not None:
+            attr.build_time = activity.duration()
+            attr.substituted = activity.substituted
 
 
 def write_shell_expression(filename: Path, attrs: List[str]) -> None:
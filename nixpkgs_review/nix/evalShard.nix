@@ -0,0 +1,13 @@
+# Selects every `shards`-th top-level attribute of nixpkgs starting at `shard`.
+# Round-robin over the sorted attribute names spreads large package sets
+# across all shards.
+{ nixpkgs, shard, shards }:
+
+with builtins;
+let
+  pkgs = import nixpkgs { };
+  names = attrNames pkgs;
+  count = (length names - shard + shards - 1) / shards;
+  selected = genList (i: elemAt names (shard + i * shards)) count;
+in
+  listToAttrs (map (name: { inherit name; value = pkgs.${name}; }) selected)
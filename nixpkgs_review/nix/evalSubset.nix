@@ -0,0 +1,16 @@
+# Selects the attribute paths given as JSON list in `attrs` from nixpkgs.
+# Attributes that do not exist (i.e. packages added or removed by the
+# reviewed change) are skipped.
+{ nixpkgs, attrs }:
+
+with builtins;
+let
+  pkgs = import nixpkgs { };
+  lib = pkgs.lib;
+  attrPaths = map (lib.splitString ".") (fromJSON attrs);
+  existing = filter (attrPath: lib.hasAttrByPath attrPath pkgs) attrPaths;
+in
+  listToAttrs (map (attrPath: {
+    name = lib.concatStringsSep "." attrPath;
+    value = lib.getAttrFromPath attrPath pkgs;
+  }) existing)
@@ -0,0 +1,41 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Generic, List, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class Stage(Generic[T]):
+    name: str
+    # number of items processed by this stage at the same time
+    jobs: int
+    run: Callable[[T], None]
+
+
+def run_pipeline(items: List[T], stages: List[Stage[T]]) -> Dict[int, Exception]:
+    """
+    Passes each item through all stages in order. Items move on
+    independently, so that i.e. the next item is evaluated while the
+    current one builds. Returns the exception by index of each item that
+    failed in a stage, later stages are skipped for those.
+    """
+    limits = [threading.Semaphore(stage.jobs) for stage in stages]
+    errors: Dict[int, Exception] = {}
+
+    def process(index: int) -> None:
+        for stage, limit in zip(stages, limits):
+            with limit:
+                try:
+                    stage.run(items[index])
+                except Exception as e:
+                    errors[index] = e
+                    return
+
+    # items waiting for a busy stage hold a worker, so there are enough
+    # workers for all stages to be busy
+    with ThreadPoolExecutor(max_workers=sum(s.jobs for s in stages)) as executor:
+        # list() re-raises exceptions of the workers
+        list(executor.map(process, range(len(items))))
+    return errors
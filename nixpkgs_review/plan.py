@@ -0,0 +1,124 @@
+import json
+import re
+import subprocess
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from .history import History, format_duration
+from .nix import Attr
+from .utils import info, warn
+
+# keep the command line of nix-store well below ARG_MAX
+DRY_RUN_BATCH_SIZE = 1000
+
+SIZE_UNITS = {"B": 1, "KiB": 1024, "MiB": 1024**2, "GiB": 1024**3, "TiB": 1024**4}
+FETCH_SIZES = re.compile(
+    r"\(([\d.]+) (\w+) download, ([\d.]+) (\w+) unpacked\)", re.IGNORECASE
+)
+
+
+@dataclass
+class BuildPlan:
+    # derivations nix would build
+    builds: Set[str] = field(default_factory=set)
+    # store paths nix would fetch from a binary cache
+    fetches: Set[str] = field(default_factory=set)
+    # in bytes, as reported by nix
+    download_size: int = 0
+    unpacked_size: int = 0
+    # median build time of previous reviews per attribute, see `History`
+    build_times: Dict[str, float] = field(default_factory=dict)
+    # attributes that need to be built but were never built before
+    unknown_build_times: List[str] = field(default_factory=list)
+
+    def estimated_build_time(self) -> float:
+        return sum(self.build_times.values())
+
+
+def parse_size(value: str, unit: str) -> int:
+    return int(float(value) * SIZE_UNITS.get(unit, 1))
+
+
+def parse_dry_run(output: str, plan: BuildPlan) -> None:
+    """
+    Parses what `nix-store --realise --dry-run` prints on stderr:
+
+      these 2 derivations will be built:
+        /nix/store/...-foo.drv
+      these 3 paths will be fetched (1.20 MiB download, 5.10 MiB unpacked):
+        /nix/store/...-bar
+    """
+    section: Optional[Set[str]] = None
+    for line in output.splitlines():
+        if line.startswith("  "):
+            if section is not None:
+                section.add(line.strip())
+        elif "will be built" in line:
+            section = plan.builds
+        elif "will be fetched" in line:
+            section = plan.fetches
+            sizes = FETCH_SIZES.search(line)
+            if sizes is not None:
+                plan.download_size += parse_size(sizes.group(1), sizes.group(2))
+                plan.unpacked_size += parse_size(sizes.group(3), sizes.group(4))
+        else:
+            section = None
+
+
+def build_plan(attrs: List[Attr], history: Optional[History]) -> BuildPlan:
+    """
+    Asks nix what it would build or fetch to build `attrs` without building
+    anything
+    """
+    plan = BuildPlan()
+    attrs = [a for a in attrs if not (a.broken or a.blacklisted) and a.drv_path]
+    drv_paths = sorted(set(a.drv_path for a in attrs if a.drv_path is not None))
+    for start in range(0, len(drv_paths), DRY_RUN_BATCH_SIZE):
+        end = start + DRY_RUN_BATCH_SIZE
+        batch = drv_paths[start:end]
+        # dependencies shared between batches are counted twice in the sizes
+        proc = subprocess.run(
+            ["nix-store", "--realise", "--dry-run"] + batch,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if proc.returncode != 0:
+            warn(f"nix-store --realise --dry-run failed:\n{proc.stderr}")
+        parse_dry_run(proc.stderr, plan)
+
+    built = [a.name for a in attrs if a.drv_path in plan.builds]
+    if history is not None:
+        plan.build_times = history.build_times(built)
+    plan.unknown_build_times = [a for a in built if a not in plan.build_times]
+    return plan
+
+
+def print_plan(plan: BuildPlan) -> None:
+    mib = 1024 * 1024
+    info(f"{len(plan.builds)} derivations will be built")
+    info(
+        f"{len(plan.fetches)} paths will be fetched "
+        f"({plan.download_size / mib:.2f} MiB download, "
+        f"{plan.unpacked_size / mib:.2f} MiB unpacked)"
+    )
+    if plan.build_times:
+        info(
+            f"Estimated build time: {format_duration(plan.estimated_build_time())} "
+            f"for {len(plan.build_times)} packages built in previous reviews"
+        )
+    if plan.unknown_build_times:
+        info(
+            f"{len(plan.unknown_build_times)} packages were not built in previous reviews: "
+            + " ".join(plan.unknown_build_times)
+        )
+
+
+def write_plan(plan: BuildPlan, path: Path) -> None:
+    data = asdict(plan)
+    data["builds"] = sorted(plan.builds)
+    data["fetches"] = sorted(plan.fetches)
+    data["estimated_build_time"] = plan.estimated_build_time()
+    with open(path, "w+") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
@@ -0,0 +1,148 @@
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from .utils import info
+
+# Activity and verbosity types of nix's `--log-format internal-json`, see
+# src/libutil/logging.hh in the nix source
+ACT_BUILD = 105
+ACT_SUBSTITUTE = 108
+RES_BUILD_LOG_LINE = 101
+LVL_INFO = 3
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+BUILDER_FAILED = re.compile(r"builder for '(/nix/store/[^']+\.drv)' failed")
+DEPENDENCIES_FAILED = re.compile(
+    r"dependencies of derivation '(/nix/store/[^']+\.drv)' failed to build"
+)
+
+
+@dataclass
+class Activity:
+    # derivation for builds, output path for substitutions
+    path: str
+    substituted: bool
+    start: float
+    end: Optional[float] = None
+    failed: bool = False
+
+    def duration(self) -> Optional[float]:
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+
+class BuildProgress:
+    """
+    Follows the internal-json log of `nix build` and records when each
+    derivation was built or substituted and whether it failed
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.running: Dict[int, Activity] = {}
+        self.builds: Dict[str, Activity] = {}
+        self.substitutions: Dict[str, Activity] = {}
+        self.failed = 0
+
+    def feed(self, line: str) -> None:
+        prefix, _, payload = line.partition(" ")
+        if prefix != "@nix":
+            sys.stderr.write(line)
+            return
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            sys.stderr.write(line)
+            return
+        action = event.get("action")
+        if action == "start":
+            self._start(event)
+        elif action == "stop":
+            self._stop(event)
+        elif action == "msg":
+            self._msg(event)
+        elif action == "result":
+            self._result(event)
+
+    def _start(self, event: Dict[str, Any]) -> None:
+        fields = event.get("fields") or []
+        if not fields:
+            return
+        if event.get("type") == ACT_BUILD:
+            activity = Activity(fields[0], substituted=False, start=self.clock())
+            self.builds[activity.path] = activity
+            verb = "building"
+        elif event.get("type") == ACT_SUBSTITUTE:
+            activity = Activity(fields[0], substituted=True, start=self.clock())
+            self.substitutions[activity.path] = activity
+            verb = "fetching"
+        else:
+            return
+        self.running[event["id"]] = activity
+        self.print_status(f"{verb} {activity.path}")
+
+    def _stop(self, event: Dict[str, Any]) -> None:
+        activity = self.running.pop(event.get("id", -1), None)
+        if activity is not None:
+            activity.end = self.clock()
+
+    def _result(self, event: Dict[str, Any]) -> None:
+        # build logs, only sent with --print-build-logs
+        fields = event.get("fields") or []
+        if event.get("type") != RES_BUILD_LOG_LINE or not fields:
+            return
+        activity = self.running.get(event.get("id", -1))
+        if activity is None:
+            print(fields[0], file=sys.stderr)
+        else:
+            # prefixed like nix does, e.g. "hello> checking for gcc"
+            name = os.path.basename(activity.path)[33:]
+            if name.endswith(".drv"):
+                name = name[: -len(".drv")]
+            print(f"{name}> {fields[0]}", file=sys.stderr)
+
+    def _msg(self, event: Dict[str, Any]) -> None:
+        msg = event.get("msg", "")
+        if event.get("level", LVL_INFO) <= LVL_INFO:
+            print(msg, file=sys.stderr)
+        msg = ANSI_ESCAPE.sub("", msg)
+        match = BUILDER_FAILED.search(msg)
+        if match is not None:
+            if not self._mark_failed(match.group(1)):
+                self.failed += 1
+            self.print_status(f"failed {match.group(1)}")
+            return
+        # not counted as failure, the dependency that failed already was
+        match = DEPENDENCIES_FAILED.search(msg)
+        if match is not None:
+            self._mark_failed(match.group(1))
+
+    def _mark_failed(self, drv_path: str) -> bool:
+        """
+        Returns whether the derivation was already marked as failed
+        """
+        activity = self.builds.get(drv_path)
+        if activity is None:
+            # nix did not start this build
+            activity = Activity(drv_path, substituted=False, start=self.clock())
+            activity.end = activity.start
+            self.builds[drv_path] = activity
+        already_failed = activity.failed
+        activity.failed = True
+        return already_failed
+
+    def print_status(self, msg: str) -> None:
+        built = sum(
+            1 for a in self.builds.values() if a.end is not None and not a.failed
+        )
+        fetched = sum(1 for a in self.substitutions.values() if a.end is not None)
+        info(
+            f"[{built} built, {self.failed} failed, {fetched} fetched, "
+            f"{len(self.running)} running] {msg}"
+        )
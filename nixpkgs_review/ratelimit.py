@@ -0,0 +1,159 @@
+import email.utils
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timezone
+from http.client import HTTPResponse
+from typing import Callable, Dict, Optional, Tuple
+
+from .utils import warn
+
+# responses worth retrying, the request probably never reached github's backend
+TRANSIENT_ERRORS = {500, 502, 503, 504}
+# only these are retried after a server error, a failed POST may still have
+# posted a comment
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+MAX_RETRIES = 5
+# first delay of the exponential backoff in seconds
+BACKOFF = 2.0
+# github asks to wait at least a minute after hitting a secondary rate limit
+SECONDARY_RATE_LIMIT_DELAY = 60.0
+# once fewer requests are left, the remaining ones are spread until the reset
+PACING_THRESHOLD = 50
+
+# rate limits apply per token and host
+Limit = Tuple[str, str]
+
+
+@dataclass
+class RequestStats:
+    requests: int = 0
+    # answered from the cache with 304 Not Modified, see `HttpCache`
+    cache_hits: int = 0
+    retries: int = 0
+    # seconds spent waiting for the rate limit or before retries
+    wait_time: float = 0.0
+
+
+class RequestScheduler:
+    """
+    Paces requests according to the X-RateLimit headers of previous responses
+    and decides which failed requests are retried and after how long
+    """
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+        jitter: Callable[[], float] = random.random,
+    ) -> None:
+        self.clock = clock
+        self._sleep = sleep
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.remaining: Dict[Limit, int] = {}
+        self.reset: Dict[Limit, float] = {}
+        self.stats = RequestStats()
+
+    def sleep(self, seconds: float) -> None:
+        with self.lock:
+            self.stats.wait_time += seconds
+        self._sleep(seconds)
+
+    def wait(self, limit: Limit) -> None:
+        """
+        Called before each request
+        """
+        with self.lock:
+            self.stats.requests += 1
+            remaining = self.remaining.get(limit)
+            reset = self.reset.get(limit)
+        if remaining is None or reset is None or remaining >= PACING_THRESHOLD:
+            return
+        delay = reset - self.clock()
+        if delay <= 0:
+            return
+        if remaining == 0:
+            warn(f"GitHub rate limit exceeded, waiting {delay:.0f}s for its reset")
+        else:
+            delay /= remaining
+        self.sleep(delay)
+
+    def update(self, limit: Limit, resp: HTTPResponse) -> None:
+        remaining = resp.getheader("X-RateLimit-Remaining")
+        reset = resp.getheader("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        with self.lock:
+            self.remaining[limit] = int(remaining)
+            self.reset[limit] = float(reset)
+
+    def backoff(self, attempt: int) -> float:
+        # spread retries of concurrent requests
+        return BACKOFF * 2.0**attempt * (0.5 + self.jitter() / 2)
+
+    def retry_after(self, resp: HTTPResponse, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait according to the Retry-After header, which is either
+        a number of seconds or an HTTP date. Invalid values fall back to the
+        exponential backoff.
+        """
+        value = resp.getheader("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return self.backoff(attempt)
+        if date.tzinfo is None:
+            # "-0000" means UTC without saying so
+            date = date.replace(tzinfo=timezone.utc)
+        return max(date.timestamp() - self.clock(), 0.0)
+
+    def retry_delay(
+        self, method: str, resp: HTTPResponse, body: bytes, attempt: int
+    ) -> Optional[float]:
+        """
+        Returns how long to wait before retrying the request or None if the
+        response is final
+        """
+        if attempt >= MAX_RETRIES:
+            return None
+        retry_after = self.retry_after(resp, attempt)
+        if resp.status in (403, 429):
+            # other 403 responses are permission errors
+            if retry_after is not None:
+                delay = retry_after
+            elif resp.getheader("X-RateLimit-Remaining") == "0":
+                reset = float(resp.getheader("X-RateLimit-Reset") or 0)
+                delay = max(reset - self.clock(), 0.0)
+            elif b"rate limit" in body.lower():
+                delay = SECONDARY_RATE_LIMIT_DELAY
+            else:
+                return None
+        elif resp.status in TRANSIENT_ERRORS and method in IDEMPOTENT_METHODS:
+            if retry_after is not None:
+                delay = retry_after
+            else:
+                delay = self.backoff(attempt)
+        else:
+            return None
+        with self.lock:
+            self.stats.retries += 1
+        return delay
+
+    def error_retry_delay(self, method: str, attempt: int) -> Optional[float]:
+        """
+        Like `retry_delay` for requests that failed without a response, e.g.
+        because the connection was reset or timed out
+        """
+        if attempt >= MAX_RETRIES or method not in IDEMPOTENT_METHODS:
+            return None
+        with self.lock:
+            self.stats.retries += 1
+        return self.backoff(attempt)
@@ -1,9 +1,15 @@
+import gzip
 import os
+import shutil
 import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, List, Optional
+from typing import IO, Callable, List, Optional
 
-from .nix import Attr
+from .nix import Attr, verify_paths
 from .utils import info, link, warn
 
 
@@ -32,11 +38,34 @@ def html_pkgs_section(packages: List[Attr], msg: str, what: str = "package") ->
         res += f"    <li>{pkg.name}"
         if len(pkg.aliases) > 0:
             res += f" ({' ,'.join(pkg.aliases)})"
+        res += format_build_time(pkg)
         res += "</li>\n"
     res += "  </ul>\n</details>\n"
     return res
 
 
+# number of builds listed in the build time summary
+SLOWEST_BUILDS = 10
+
+
+def print_slowest_builds(attrs: List[Attr]) -> None:
+    built = [a for a in attrs if a.build_time is not None and not a.substituted]
+    if len(built) == 0:
+        return
+    built.sort(key=lambda a: a.build_time or 0.0, reverse=True)
+    info("Slowest builds:")
+    for attr in built[:SLOWEST_BUILDS]:
+        print(f"{attr.build_time or 0.0:8.1f}s {attr.name}")
+    print("")
+
+
+def format_build_time(attr: Attr) -> str:
+    if attr.build_time is None:
+        return ""
+    how = "substituted" if attr.substituted else "built"
+    return f" [{how} in {attr.build_time:.1f}s]"
+
+
 class LazyDirectory:
     def __init__(self, path: Path) -> None:
         self.path = path
@@ -49,10 +78,43 @@ class LazyDirectory:
         return self.path
 
 
-def write_error_logs(attrs: List[Attr], directory: Path) -> None:
+@dataclass
+class LogOptions:
+    # also fetch logs of packages that were built successfully
+    all: bool = False
+    # only keep the last lines of each log
+    tail: Optional[int] = None
+    # write gzip compressed logs
+    compress: bool = False
+    # number of `nix log` processes running in parallel
+    jobs: int = 8
+
+
+def write_log(drv_path: str, path: Path, options: LogOptions) -> None:
+    cmd = ["nix", "--experimental-features", "nix-command", "log", drv_path]
+    with ExitStack() as stack:
+        if options.compress:
+            f: IO[str] = stack.enter_context(gzip.open(path, "wt"))
+        else:
+            f = stack.enter_context(open(path, "w+"))
+        proc = stack.enter_context(
+            subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, errors="replace")
+        )
+        assert proc.stdout
+        if options.tail is None:
+            shutil.copyfileobj(proc.stdout, f)
+        else:
+            f.write(f"# last {options.tail} lines, full log: nix log {drv_path}\n")
+            f.writelines(deque(proc.stdout, maxlen=options.tail))
+
+
+def write_error_logs(
+    attrs: List[Attr], directory: Path, options: LogOptions = LogOptions()
+) -> None:
     logs = LazyDirectory(directory.joinpath("logs"))
     results = LazyDirectory(directory.joinpath("results"))
     failed_results = LazyDirectory(directory.joinpath("failed_results"))
+    with_logs = []
     for attr in attrs:
         if attr.path is not None and os.path.exists(attr.path):
             if attr.was_build():
@@ -63,31 +125,38 @@ def write_error_logs(attrs: List[Attr], directory: Path) -> None:
                 symlink_source.unlink()
             symlink_source.symlink_to(attr.path)
 
-        if attr.drv_path is not None:
-            with open(logs.ensure().joinpath(attr.name + ".log"), "w+") as f:
-                subprocess.run(
-                    [
-                        "nix",
-                        "--experimental-features",
-                        "nix-command",
-                        "log",
-                        attr.drv_path,
-                    ],
-                    stdout=f,
-                )
+        if attr.drv_path is not None and (options.all or not attr.was_build()):
+            with_logs.append(attr)
+
+    suffix = ".log.gz" if options.compress else ".log"
+
+    def fetch(attr: Attr) -> None:
+        assert attr.drv_path is not None
+        write_log(attr.drv_path, logs.path.joinpath(attr.name + suffix), options)
+
+    if with_logs:
+        logs.ensure()
+    with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+        # list() re-raises exceptions of the workers
+        list(executor.map(fetch, with_logs))
 
 
 class Report:
-    def __init__(self, system: str, attrs: List[Attr]) -> None:
+    def __init__(
+        self, system: str, attrs: List[Attr], log_options: LogOptions = LogOptions()
+    ) -> None:
         self.system = system
         self.attrs = attrs
+        self.log_options = log_options
         self.broken: List[Attr] = []
         self.failed: List[Attr] = []
+        self.skipped: List[Attr] = []
         self.non_existant: List[Attr] = []
         self.blacklisted: List[Attr] = []
         self.tests: List[Attr] = []
         self.built: List[Attr] = []
 
+        verify_paths(attrs)
         for a in attrs:
             if a.broken:
                 self.broken.append(a)
@@ -97,6 +166,8 @@ class Report:
                 self.non_existant.append(a)
             elif a.name.startswith("nixosTests."):
                 self.tests.append(a)
+            elif a.skipped:
+                self.skipped.append(a)
             elif not a.was_build():
                 self.failed.append(a)
             else:
@@ -109,11 +180,11 @@ class Report:
         with open(directory.joinpath("report.md"), "w+") as f:
             f.write(self.markdown(pr))
 
-        write_error_logs(self.attrs, directory)
+        write_error_logs(self.attrs, directory, self.log_options)
 
     def succeeded(self) -> bool:
         """Whether the report is considered a success or a failure"""
-        return len(self.failed) == 0
+        return len(self.failed) == 0 and len(self.skipped) == 0
 
     def markdown(self, pr: Optional[int]) -> str:
         cmd = "nixpkgs-review"
@@ -129,6 +200,9 @@ class Report:
         )
         msg += html_pkgs_section(self.blacklisted, "blacklisted")
         msg += html_pkgs_section(self.failed, "failed to build")
+        msg += html_pkgs_section(
+            self.skipped, "not built because the build was stopped early"
+        )
         msg += html_pkgs_section(self.tests, "built", what="test")
         msg += html_pkgs_section(self.built, "built")
 
@@ -146,5 +220,7 @@ class Report:
         )
         print_number(self.blacklisted, "blacklisted")
         print_number(self.failed, "failed to build")
+        print_number(self.skipped, "not built because the build was stopped early")
         print_number(self.tests, "built", what="tests", log=print)
         print_number(self.built, "built", log=print)
+        print_slowest_builds(self.attrs)
@@ -0,0 +1,89 @@
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .nix import Attr
+
+STATE_FILE = "review.json"
+
+
+@dataclass
+class ReviewState:
+    """
+    What is needed to continue an interrupted or failed review in the same
+    build directory: how the worktree was checked out and the evaluated
+    attributes
+    """
+
+    # commit the worktree was created from
+    base: Optional[str] = None
+    # commit merged into the worktree
+    merge: Optional[str] = None
+    # whether uncommitted (or only staged) changes were applied
+    wip: bool = False
+    staged: bool = False
+    attrs: List[Attr] = field(default_factory=list)
+
+
+def encode_attr(attr: Attr) -> Dict[str, Any]:
+    return dict(
+        name=attr.name,
+        exists=attr.exists,
+        broken=attr.broken,
+        blacklisted=attr.blacklisted,
+        path=attr.path,
+        drv_path=attr.drv_path,
+        aliases=attr.aliases,
+        build_time=attr.build_time,
+        substituted=attr.substituted,
+    )
+
+
+def decode_attr(data: Dict[str, Any]) -> Attr:
+    attr = Attr(
+        name=data["name"],
+        exists=data["exists"],
+        broken=data["broken"],
+        blacklisted=data["blacklisted"],
+        path=data["path"],
+        drv_path=data["drv_path"],
+        aliases=data["aliases"],
+    )
+    attr.build_time = data["build_time"]
+    attr.substituted = data["substituted"]
+    return attr
+
+
+def save_state(directory: Path, state: ReviewState) -> None:
+    path = directory.joinpath(STATE_FILE)
+    tmp = directory.joinpath(STATE_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(
+            dict(
+                base=state.base,
+                merge=state.merge,
+                wip=state.wip,
+                staged=state.staged,
+                attrs=[encode_attr(a) for a in state.attrs],
+            ),
+            f,
+        )
+    # an interrupted review must not leave a truncated file behind
+    os.replace(tmp, path)
+
+
+def load_state(directory: Path) -> Optional[ReviewState]:
+    try:
+        with open(directory.joinpath(STATE_FILE)) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    return ReviewState(
+        base=data["base"],
+        merge=data["merge"],
+        wip=data["wip"],
+        staged=data["staged"],
+        attrs=[decode_attr(a) for a in data["attrs"]],
+    )
@@ -1,18 +1,57 @@
 import argparse
+import json
 import os
 import subprocess
 import sys
+import threading
+import time
 import xml.etree.ElementTree as ET
-from dataclasses import dataclass, field
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from enum import Enum
 from pathlib import Path
-from typing import IO, Dict, List, Optional, Pattern, Set, Tuple
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Set,
+    Tuple,
+)
 
 from .builddir import Builddir
-from .github import GithubClient
-from .nix import Attr, nix_build, nix_eval, nix_shell
-from .report import Report
-from .utils import info, sh, warn
+from .evalcache import EvalCache, default_eval_cache
+from .github import GithubClient, PullRequest
+from .history import History, Run, default_history
+from .httpcache import default_http_cache
+from .incremental import DependencyIndex, changed_files
+from .nix import (
+    Attr,
+    AttrCache,
+    BuildOptions,
+    EvalOptions,
+    build_attrs,
+    build_union,
+    invalid_paths,
+    nix_eval,
+    nix_shell,
+    nix_version,
+    verify_paths,
+)
+from .plan import build_plan, print_plan, write_plan
+from .report import LogOptions, Report
+from .resume import ReviewState, load_state, save_state
+from .utils import ROOT, info, memory_limit_command, sh, warn
+from .worktree import default_worktree_pool
+
+# serializes git commands that would race when multiple pull requests are
+# reviewed at the same time
+git_lock = threading.Lock()
 
 
 class CheckoutOption(Enum):
@@ -61,8 +100,30 @@ def print_packages(
     print("")
 
 
-@dataclass
+def intern(value: Optional[str]) -> Optional[str]:
+    return None if value is None else sys.intern(value)
+
+
 class Package:
+    """
+    A package of a nixpkgs evaluation. A review holds hundreds of thousands of
+    these, so they are slotted and strings that repeat within and between the
+    base and the merged evaluation (attribute paths, store paths, versions)
+    are interned.
+    """
+
+    __slots__ = (
+        "pname",
+        "version",
+        "attr_path",
+        "store_path",
+        "homepage",
+        "description",
+        "position",
+        "drv_path",
+        "old_pkg",
+    )
+
     pname: str
     version: str
     attr_path: str
@@ -70,7 +131,45 @@ class Package:
     homepage: Optional[str]
     description: Optional[str]
     position: Optional[str]
-    old_pkg: "Optional[Package]" = field(init=False)
+    drv_path: Optional[str]
+    old_pkg: "Optional[Package]"
+
+    def __init__(
+        self,
+        pname: str,
+        version: str,
+        attr_path: str,
+        store_path: Optional[str],
+        homepage: Optional[str],
+        description: Optional[str],
+        position: Optional[str],
+        drv_path: Optional[str] = None,
+    ) -> None:
+        self.pname = sys.intern(pname)
+        self.version = sys.intern(version)
+        self.attr_path = sys.intern(attr_path)
+        self.store_path = intern(store_path)
+        self.homepage = intern(homepage)
+        # mostly unique, interning would only add overhead
+        self.description = description
+        self.position = position
+        self.drv_path = intern(drv_path)
+        self.old_pkg = None
+
+    def __repr__(self) -> str:
+        return f"Package(attr_path={self.attr_path!r}, store_path={self.store_path!r})"
+
+
+class SortedPackages(List[Package]):
+    """
+    Packages sorted by attribute path, which `differences` compares without
+    building a dict of all packages
+    """
+
+
+def package_list(packages: Iterable[Package]) -> List[Package]:
+    # keeps `SortedPackages` intact
+    return packages if isinstance(packages, list) else list(packages)
 
 
 def print_updates(changed_pkgs: List[Package], removed_pkgs: List[Package]) -> None:
@@ -107,25 +206,77 @@ class Review:
         skip_packages: Set[str] = set(),
         skip_packages_regex: List[Pattern[str]] = [],
         checkout: CheckoutOption = CheckoutOption.MERGE,
+        eval_parallel: bool = False,
+        eval_cache: Optional[EvalCache] = None,
+        eval_shards: int = 1,
+        eval_memory_limit: Optional[int] = None,
+        eval_incremental: bool = False,
+        eval_workers: int = 1,
+        log_options: LogOptions = LogOptions(),
+        history: Optional[History] = None,
+        plan: bool = False,
+        build_options: BuildOptions = BuildOptions(),
+        resume: bool = False,
     ) -> None:
         self.builddir = builddir
         self.build_args = build_args
         self.no_shell = no_shell
-        self.github_client = GithubClient(api_token)
+        self.github_client = GithubClient(api_token, cache=default_http_cache())
         self.use_ofborg_eval = use_ofborg_eval
         self.checkout = checkout
         self.only_packages = only_packages
         self.package_regex = package_regexes
         self.skip_packages = skip_packages
         self.skip_packages_regex = skip_packages_regex
+        self.eval_parallel = eval_parallel
+        self.eval_cache = eval_cache
+        self.eval_shards = eval_shards
+        self.eval_memory_limit = eval_memory_limit
+        self.eval_incremental = eval_incremental
+        self.log_options = log_options
+        self.attr_cache = AttrCache(eval_cache)
+        self.eval_options = EvalOptions(
+            workers=eval_workers,
+            memory_limit=eval_memory_limit,
+            cache=self.attr_cache,
+            # reviews of multiple pull requests can evaluate concurrently
+            nix_path=builddir.nixpkgs_path(),
+        )
+        self._nix_version: Optional[str] = None
+        self.history = history
+        self.plan = plan
+        self.build_options = build_options
+        self.resume = resume
+        # how the worktree was checked out and what was evaluated, persisted
+        # in the build directory to resume the review
+        self.state = ReviewState()
+        # stages of a review, see `build_pr`
+        self.resumed_state: Optional[ReviewState] = None
+        self.fetched_pr: Optional[Tuple[str, str, Optional[Dict[str, Set[str]]]]] = None
+        self.pending: List[Attr] = []
+        # what is reviewed, as recorded in the history
+        self.run_kind = "pr"
+        self.run_target = ""
+        self.started = time.time()
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
 
     def worktree_dir(self) -> str:
         return str(self.builddir.worktree_dir)
 
     def git_merge(self, commit: str) -> None:
+        self.state.merge = commit
         sh(["git", "merge", "--no-commit", commit], cwd=self.worktree_dir())
 
     def apply_unstaged(self, staged: bool = False) -> None:
+        self.state.wip, self.state.staged = True, staged
         args = ["git", "--no-pager", "diff"]
         args.extend(["--staged"] if staged else [])
         diff_proc = subprocess.Popen(args, stdout=subprocess.PIPE)
@@ -143,29 +294,190 @@ class Review:
             warn("Failed to apply diff in %s" % self.worktree_dir())
             sys.exit(1)
 
+    def apply_changes(self, reviewed_commit: Optional[str], staged: bool) -> None:
+        if reviewed_commit is None:
+            self.apply_unstaged(staged)
+        else:
+            self.git_merge(reviewed_commit)
+
+    def cache_key(self, kind: str, tree: str, check_meta: bool) -> str:
+        if self._nix_version is None:
+            self._nix_version = nix_version()
+        return f"{kind}:{tree}:{int(check_meta)}:{self._nix_version}"
+
+    def list_packages(
+        self, path: str, tree: Optional[str], check_meta: bool = False
+    ) -> Iterable[Package]:
+        """
+        Like `iter_packages`, but served from the evaluation cache if the git
+        tree of `path` was evaluated before
+        """
+        if self.eval_cache is None or tree is None:
+            if self.eval_shards > 1:
+                return list_packages(
+                    path, check_meta, self.eval_shards, self.eval_memory_limit
+                )
+            return iter_packages(path, check_meta, memory_limit=self.eval_memory_limit)
+        key = self.cache_key("packages", tree, check_meta)
+        data = self.eval_cache.get(key)
+        if data is not None:
+            info(f"Using cached evaluation of tree {tree}")
+            return decode_packages(data)
+        packages = list_packages(
+            path, check_meta, self.eval_shards, self.eval_memory_limit
+        )
+        # sorted for the cache anyway
+        packages.sort(key=attr_path_key)
+        self.eval_cache.put(key, encode_packages(packages))
+        return SortedPackages(packages)
+
+    def cached_tree(self, rev: Optional[str]) -> Optional[str]:
+        """
+        Tree hash of `rev` or of the merge in the worktree, if an evaluation
+        cache is used and the tree can be identified
+        """
+        if self.eval_cache is None:
+            return None
+        if rev is None:
+            return git_tree_hash(self.worktree_dir())
+        return git_tree_hash(self.worktree_dir(), rev)
+
+    def list_packages_parallel(
+        self, base_commit: str, reviewed_commit: Optional[str], staged: bool
+    ) -> Tuple[List[Package], Iterable[Package]]:
+        """
+        Checkout the base commit into a second worktree so that the base and
+        the merged tree can be evaluated at the same time
+        """
+        base_worktree_dir = str(self.builddir.base_worktree_dir)
+        # see `git_worktree`
+        with git_lock:
+            sh(["git", "worktree", "add", base_worktree_dir, base_commit])
+        base_tree = self.cached_tree(base_commit)
+        self.apply_changes(reviewed_commit, staged)
+        merged_tree = self.cached_tree(None) if reviewed_commit else None
+
+        def evaluate(path: str, tree: Optional[str], check_meta: bool) -> List[Package]:
+            return package_list(self.list_packages(path, tree, check_meta))
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            base = executor.submit(evaluate, base_worktree_dir, base_tree, False)
+            merged = executor.submit(evaluate, self.worktree_dir(), merged_tree, True)
+            return base.result(), merged.result()
+
+    def dependency_index(self, base_tree: str) -> DependencyIndex:
+        assert self.eval_cache is not None
+        key = self.cache_key("index", base_tree, True)
+        data = self.eval_cache.get(key)
+        if data is not None:
+            return DependencyIndex.decode(data)
+        info("Build dependency index for incremental evaluation...")
+        packages = list_packages(
+            self.worktree_dir(),
+            check_meta=True,
+            shards=self.eval_shards,
+            memory_limit=self.eval_memory_limit,
+            drv_path=True,
+        )
+        index = DependencyIndex.build(
+            self.worktree_dir(),
+            ((p.attr_path, p.position, p.drv_path) for p in packages),
+        )
+        self.eval_cache.put(key, index.encode())
+        return index
+
+    def list_packages_incremental(
+        self, base_commit: str, reviewed_commit: Optional[str], staged: bool
+    ) -> Optional[Tuple[List[Package], List[Package]]]:
+        """
+        Only evaluate packages affected by the changed files and their reverse
+        dependencies. Returns None if a full evaluation is needed instead.
+        """
+        assert self.eval_cache is not None
+        index = self.dependency_index(git_tree_hash(self.worktree_dir(), base_commit))
+        attrs = index.affected_attrs(
+            changed_files(base_commit, reviewed_commit, staged)
+        )
+        if attrs is None:
+            return None
+        info(f"Evaluating {len(attrs)} affected packages")
+        if len(attrs) == 0:
+            self.apply_changes(reviewed_commit, staged)
+            return [], []
+        base_packages = list(
+            iter_packages(
+                self.worktree_dir(), memory_limit=self.eval_memory_limit, attrs=attrs
+            )
+        )
+        self.apply_changes(reviewed_commit, staged)
+        merged_packages = list(
+            iter_packages(
+                self.worktree_dir(),
+                check_meta=True,
+                memory_limit=self.eval_memory_limit,
+                attrs=attrs,
+            )
+        )
+        return base_packages, merged_packages
+
     def build_commit(
         self, base_commit: str, reviewed_commit: Optional[str], staged: bool = False
     ) -> List[Attr]:
         """
         Review a local git commit
         """
+        attrs = self.prepare_commit(base_commit, reviewed_commit, staged)
+        self.build_pending()
+        return attrs
+
+    def prepare_commit(
+        self, base_commit: str, reviewed_commit: Optional[str], staged: bool = False
+    ) -> List[Attr]:
         self.git_worktree(base_commit)
-        base_packages = list_packages(str(self.worktree_dir()))
+        with self.phase("evaluate"):
+            changed_attrs = self.evaluate_commit(base_commit, reviewed_commit, staged)
+        return self.evaluate(changed_attrs)
+
+    def evaluate_commit(
+        self, base_commit: str, reviewed_commit: Optional[str], staged: bool
+    ) -> Set[str]:
+        incremental = None
+        if self.eval_incremental:
+            incremental = self.list_packages_incremental(
+                base_commit, reviewed_commit, staged
+            )
 
-        if reviewed_commit is None:
-            self.apply_unstaged(staged)
+        merged_packages: Iterable[Package]
+        if incremental is not None:
+            base_packages, merged_packages = incremental
+        elif self.eval_parallel:
+            base_packages, merged_packages = self.list_packages_parallel(
+                base_commit, reviewed_commit, staged
+            )
         else:
-            self.git_merge(reviewed_commit)
-
-        merged_packages = list_packages(str(self.worktree_dir()), check_meta=True)
+            # the base has to be evaluated completely before the worktree changes
+            base_packages = package_list(
+                self.list_packages(self.worktree_dir(), self.cached_tree(base_commit))
+            )
+            self.apply_changes(reviewed_commit, staged)
+            # uncommitted changes have no tree we could use as cache key
+            merged_tree = self.cached_tree(None) if reviewed_commit else None
+            merged_packages = self.list_packages(
+                self.worktree_dir(), merged_tree, check_meta=True
+            )
 
         changed_pkgs, removed_pkgs = differences(base_packages, merged_packages)
-        changed_attrs = set(p.attr_path for p in changed_pkgs)
         print_updates(changed_pkgs, removed_pkgs)
-        return self.build(changed_attrs, self.build_args)
+        return set(p.attr_path for p in changed_pkgs)
 
     def git_worktree(self, commit: str) -> None:
-        sh(["git", "worktree", "add", self.worktree_dir(), commit])
+        self.state.base = commit
+        # git worktree add is not safe to run concurrently, see `pipeline`
+        with git_lock:
+            if self.builddir.worktree is not None:
+                self.builddir.worktree.checkout(commit)
+            else:
+                sh(["git", "worktree", "add", self.worktree_dir(), commit])
 
     def checkout_pr(self, base_rev: str, pr_rev: str) -> None:
         if self.checkout == CheckoutOption.MERGE:
@@ -174,28 +486,123 @@ class Review:
         else:
             self.git_worktree(pr_rev)
 
-    def build(self, packages: Set[str], args: str) -> List[Attr]:
-        packages = filter_packages(
-            packages,
-            self.only_packages,
-            self.package_regex,
-            self.skip_packages,
-            self.skip_packages_regex,
+    def evaluate(self, packages: Set[str]) -> List[Attr]:
+        """
+        Evaluates the attributes to build, which are built by `build_pending`
+        """
+        if self.eval_cache is not None:
+            # only persist results of nix eval if the checkout can be identified
+            tree = worktree_tree_hash(self.worktree_dir())
+            if tree is not None:
+                self.attr_cache.scope = self.cache_key("attrs", tree, True)
+        with self.phase("evaluate"):
+            packages = filter_packages(
+                packages,
+                self.only_packages,
+                self.package_regex,
+                self.skip_packages,
+                self.skip_packages_regex,
+                self.eval_options,
+            )
+            if not packages:
+                info("Nothing to be built.")
+                return []
+            attrs = nix_eval(packages, self.eval_options)
+        if self.plan:
+            # only evaluate, see `start_review`
+            return attrs
+        self.state.attrs = attrs
+        save_state(self.builddir.path, self.state)
+        self.pending = attrs
+        return attrs
+
+    def build_pending(self) -> None:
+        if not self.pending:
+            return
+        with self.phase("build"):
+            build_attrs(
+                self.pending, self.build_args, self.builddir.path, self.build_options
+            )
+        save_state(self.builddir.path, self.state)
+        self.pending = []
+
+    def resumable_state(self) -> Optional[ReviewState]:
+        if not self.resume:
+            return None
+        state = load_state(self.builddir.path)
+        if state is None or state.base is None:
+            warn(f"No previous review found in {self.builddir.path}, starting over")
+            return None
+        return state
+
+    def resume_build(self, state: ReviewState) -> List[Attr]:
+        attrs = self.prepare_resume(state)
+        self.build_pending()
+        return attrs
+
+    def prepare_resume(self, state: ReviewState) -> List[Attr]:
+        """
+        Checks out the worktree of a previous review again, only the
+        attributes that were not built successfully are built again
+        """
+        assert state.base is not None
+        self.git_worktree(state.base)
+        if state.merge is not None:
+            self.git_merge(state.merge)
+        elif state.wip:
+            self.apply_unstaged(state.staged)
+        self.state.attrs = state.attrs
+
+        verify_paths(state.attrs)
+        retry = [
+            a
+            for a in state.attrs
+            if a.exists and not (a.broken or a.blacklisted) and not a.was_build()
+        ]
+        info(
+            f"Resuming review in {self.builddir.path}: "
+            f"{len(state.attrs) - len(retry)} packages done, retrying {len(retry)}"
         )
-        return nix_build(packages, args, self.builddir.path)
+        self.pending = retry
+        return state.attrs
 
-    def build_pr(self, pr_number: int) -> List[Attr]:
-        pr = self.github_client.pull_request(pr_number)
+    def build_pr(
+        self,
+        pr_number: int,
+        pull: Optional[PullRequest] = None,
+        revs: Optional[Tuple[str, str]] = None,
+    ) -> List[Attr]:
+        """
+        Review a pull request. `pull` and `revs` are passed if the pull request
+        and its commits were already fetched, see
+        `GithubClient.fetch_pull_requests` and `fetch_pull_requests`.
+        """
+        self.fetch_pr(pr_number, pull, revs)
+        attrs = self.evaluate_pr()
+        self.build_pending()
+        return attrs
 
-        if self.use_ofborg_eval:
-            packages_per_system = self.github_client.get_borg_eval_gist(pr)
-        else:
-            packages_per_system = None
-        merge_rev, pr_rev = fetch_refs(
-            "https://github.com/NixOS/nixpkgs",
-            pr["base"]["ref"],
-            f"pull/{pr['number']}/head",
-        )
+    def fetch_pr(
+        self,
+        pr_number: int,
+        pull: Optional[PullRequest] = None,
+        revs: Optional[Tuple[str, str]] = None,
+    ) -> None:
+        self.run_kind, self.run_target = "pr", str(pr_number)
+        self.resumed_state = self.resumable_state()
+        if self.resumed_state is not None:
+            return
+        with self.phase("fetch"):
+            if pull is None:
+                pull = self.github_client.fetch_pull_request(
+                    pr_number, bool(self.use_ofborg_eval)
+                )
+            pr = pull.data
+            packages_per_system = pull.borg_eval if self.use_ofborg_eval else None
+            if revs is None:
+                fetched = fetch_pull_requests("https://github.com/NixOS/nixpkgs", [pr])
+                revs = fetched[pr["number"]]
+            merge_rev, pr_rev = revs
 
         if self.checkout == CheckoutOption.MERGE:
             base_rev = merge_rev
@@ -207,14 +614,24 @@ class Review:
                 text=True,
             )
             base_rev = run.stdout.strip()
+        self.fetched_pr = (base_rev, pr_rev, packages_per_system)
+
+    def evaluate_pr(self) -> List[Attr]:
+        """
+        Checks out and evaluates the pull request fetched by `fetch_pr`
+        """
+        if self.resumed_state is not None:
+            return self.prepare_resume(self.resumed_state)
+        assert self.fetched_pr is not None
+        base_rev, pr_rev, packages_per_system = self.fetched_pr
 
         if packages_per_system is None:
-            return self.build_commit(base_rev, pr_rev)
+            return self.prepare_commit(base_rev, pr_rev)
 
         self.checkout_pr(base_rev, pr_rev)
 
         packages = native_packages(packages_per_system)
-        return self.build(packages, self.build_args)
+        return self.evaluate(packages)
 
     def start_review(
         self,
@@ -223,12 +640,23 @@ class Review:
         pr: Optional[int] = None,
         post_result: Optional[bool] = False,
     ) -> None:
+        if self.plan:
+            plan = build_plan(attr, self.history)
+            print_plan(plan)
+            write_plan(plan, path.joinpath("plan.json"))
+            return
+
         os.environ["NIX_PATH"] = path.as_posix()
         if pr:
             os.environ["PR"] = str(pr)
-        report = Report(current_system(), attr)
-        report.print_console(pr)
-        report.write(path, pr)
+        with self.phase("report"):
+            system = current_system()
+            report = Report(system, attr, self.log_options)
+            report.print_console(pr)
+            report.write(path, pr)
+        if self.history is not None:
+            run = Run(self.run_kind, self.run_target, system, self.started, self.phases)
+            self.history.record(run, report)
 
         if pr and post_result:
             self.github_client.comment_issue(pr, report.markdown(pr))
@@ -246,46 +674,43 @@ class Review:
         reviewed_commit: Optional[str],
         staged: bool = False,
     ) -> None:
-        branch_rev = fetch_refs(remote, branch)[0]
+        if reviewed_commit is None:
+            self.run_kind, self.run_target = "wip", branch
+        else:
+            self.run_kind, self.run_target = "rev", reviewed_commit
+        state = self.resumable_state()
+        if state is not None:
+            self.start_review(self.resume_build(state), path)
+            return
+        with self.phase("fetch"):
+            branch_rev = fetch_refs(remote, branch)[0]
         self.start_review(self.build_commit(branch_rev, reviewed_commit, staged), path)
 
 
-def parse_packages_xml(stdout: IO[bytes]) -> List[Package]:
-    packages: List[Package] = []
+def parse_packages_xml(stdout: IO[Any]) -> Iterator[Package]:
+    """
+    Parse the output of `nix-env -qaP --xml` incrementally. Each `<item>` is
+    discarded once its package has been yielded, so memory usage does not
+    grow with the size of the document.
+    """
     path = None
+    homepage = None
+    description = None
+    position = None
     context = ET.iterparse(stdout, events=("start", "end"))
-    for (event, elem) in context:
-        if elem.tag == "item":
-            if event == "start":
-                attrs = elem.attrib
-                homepage = None
-                description = None
-                position = None
-                path = None
-            else:
-                assert attrs is not None
-                if path is None:
-                    # architecture not supported
-                    continue
-                pkg = Package(
-                    pname=attrs["pname"],
-                    version=attrs["version"],
-                    attr_path=attrs["attrPath"],
-                    store_path=path,
-                    homepage=homepage,
-                    description=description,
-                    position=position,
-                )
-                packages.append(pkg)
-        elif event == "start" and elem.tag == "output" and elem.attrib["name"] == "out":
-            path = elem.attrib["path"]
-        elif event == "start" and elem.tag == "meta":
+    _, root = next(context)
+    for event, elem in context:
+        if event == "start":
+            continue
+        if elem.tag == "output":
+            if elem.attrib["name"] == "out":
+                path = elem.attrib["path"]
+        elif elem.tag == "meta":
             name = elem.attrib["name"]
             if name not in ["homepage", "description", "position"]:
                 continue
             if elem.attrib["type"] == "strings":
-                values = (e.attrib["value"] for e in elem.getchildren())
-                value = ", ".join(values)
+                value = ", ".join(e.attrib["value"] for e in elem)
             else:
                 value = elem.attrib["value"]
             if name == "homepage":
@@ -294,14 +719,120 @@ def parse_packages_xml(stdout: IO[bytes]) -> List[Package]:
                 description = value
             elif name == "position":
                 position = value
-    return packages
+        elif elem.tag == "item":
+            # no path: architecture not supported
+            if path is not None:
+                attrs = elem.attrib
+                yield Package(
+                    pname=attrs["pname"],
+                    version=attrs["version"],
+                    attr_path=attrs["attrPath"],
+                    store_path=path,
+                    homepage=homepage,
+                    description=description,
+                    position=position,
+                    drv_path=attrs.get("drvPath"),
+                )
+            path = None
+            homepage = None
+            description = None
+            position = None
+            # drop all items parsed so far from the document tree
+            root.clear()
+
+
+def encode_packages(packages: List[Package]) -> bytes:
+    rows = [
+        (
+            p.pname,
+            p.version,
+            p.attr_path,
+            p.store_path,
+            p.homepage,
+            p.description,
+            p.position,
+            p.drv_path,
+        )
+        for p in sorted(packages, key=attr_path_key)
+    ]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_packages(data: bytes) -> SortedPackages:
+    rows = json.loads(zlib.decompress(data))
+    # see `encode_packages`
+    return SortedPackages(Package(*row) for row in rows)
 
 
-def list_packages(path: str, check_meta: bool = False) -> List[Package]:
-    cmd = [
-        "nix-env",
-        "-f",
-        path,
+def git_tree_hash(worktree: str, rev: Optional[str] = None) -> str:
+    if rev is None:
+        # the tree of the index, i.e. a merge that was not yet committed
+        cmd = ["git", "write-tree"]
+    else:
+        cmd = ["git", "rev-parse", "--verify", f"{rev}^{{tree}}"]
+    proc = subprocess.run(
+        cmd, cwd=worktree, check=True, stdout=subprocess.PIPE, text=True
+    )
+    return proc.stdout.strip()
+
+
+def worktree_tree_hash(worktree: str) -> Optional[str]:
+    """
+    Tree hash of the checkout in `worktree` or None if it has changes that are
+    not in the index
+    """
+    unstaged = subprocess.run(["git", "diff", "--quiet"], cwd=worktree)
+    untracked = subprocess.run(
+        ["git", "ls-files", "--others", "--exclude-standard"],
+        cwd=worktree,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    if unstaged.returncode != 0 or untracked.stdout != "":
+        return None
+    return git_tree_hash(worktree)
+
+
+def iter_packages(
+    path: str,
+    check_meta: bool = False,
+    shard: Optional[Tuple[int, int]] = None,
+    memory_limit: Optional[int] = None,
+    drv_path: bool = False,
+    attrs: Optional[Set[str]] = None,
+) -> Iterator[Package]:
+    if attrs is not None:
+        cmd = [
+            "nix-env",
+            "-f",
+            str(ROOT.joinpath("nix/evalSubset.nix")),
+            "--argstr",
+            "nixpkgs",
+            path,
+            "--argstr",
+            "attrs",
+            json.dumps(sorted(attrs)),
+        ]
+    elif shard is None:
+        cmd = ["nix-env", "-f", path]
+    else:
+        index, shards = shard
+        cmd = [
+            "nix-env",
+            "-f",
+            str(ROOT.joinpath("nix/evalShard.nix")),
+            "--argstr",
+            "nixpkgs",
+            path,
+            "--arg",
+            "shard",
+            str(index),
+            "--arg",
+            "shards",
+            str(shards),
+        ]
+    cmd += [
         "-qaP",
         "--xml",
         "--out-path",
@@ -309,21 +840,56 @@ def list_packages(path: str, check_meta: bool = False) -> List[Package]:
     ]
     if check_meta:
         cmd.append("--meta")
+    if drv_path:
+        cmd.append("--drv-path")
+    cmd = memory_limit_command(cmd, memory_limit)
     info("$ " + " ".join(cmd))
     proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
     with proc as nix_env:
         assert nix_env.stdout
-        return parse_packages_xml(nix_env.stdout)
+        yield from parse_packages_xml(nix_env.stdout)
+    # a partial evaluation that hit the memory limit would otherwise silently
+    # lose packages
+    if (shard is not None or attrs is not None) and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def list_packages(
+    path: str,
+    check_meta: bool = False,
+    shards: int = 1,
+    memory_limit: Optional[int] = None,
+    drv_path: bool = False,
+) -> List[Package]:
+    if shards <= 1:
+        return list(
+            iter_packages(
+                path, check_meta, memory_limit=memory_limit, drv_path=drv_path
+            )
+        )
+
+    def evaluate(index: int) -> List[Package]:
+        return list(
+            iter_packages(path, check_meta, (index, shards), memory_limit, drv_path)
+        )
+
+    packages: List[Package] = []
+    with ThreadPoolExecutor(max_workers=min(shards, os.cpu_count() or 1)) as executor:
+        for shard_packages in executor.map(evaluate, range(shards)):
+            packages.extend(shard_packages)
+    return packages
 
 
 def package_attrs(
-    package_set: Set[str], ignore_nonexisting: bool = True
+    package_set: Set[str],
+    ignore_nonexisting: bool = True,
+    eval_options: EvalOptions = EvalOptions(),
 ) -> Dict[str, Attr]:
     attrs: Dict[str, Attr] = {}
 
     nonexisting = []
 
-    for attr in nix_eval(package_set):
+    for attr in nix_eval(package_set, eval_options):
         if not attr.exists:
             nonexisting.append(attr.name)
         elif not attr.broken:
@@ -337,9 +903,15 @@ def package_attrs(
     return attrs
 
 
-def join_packages(changed_packages: Set[str], specified_packages: Set[str]) -> Set[str]:
-    changed_attrs = package_attrs(changed_packages)
-    specified_attrs = package_attrs(specified_packages, ignore_nonexisting=False)
+def join_packages(
+    changed_packages: Set[str],
+    specified_packages: Set[str],
+    eval_options: EvalOptions = EvalOptions(),
+) -> Set[str]:
+    changed_attrs = package_attrs(changed_packages, eval_options=eval_options)
+    specified_attrs = package_attrs(
+        specified_packages, ignore_nonexisting=False, eval_options=eval_options
+    )
 
     tests: Dict[str, Attr] = {}
     for path, attr in specified_attrs.items():
@@ -366,6 +938,7 @@ def filter_packages(
     package_regexes: List[Pattern[str]],
     skip_packages: Set[str],
     skip_package_regexes: List[Pattern[str]],
+    eval_options: EvalOptions = EvalOptions(),
 ) -> Set[str]:
     packages: Set[str] = set()
 
@@ -378,7 +951,7 @@ def filter_packages(
         return changed_packages
 
     if len(specified_packages) > 0:
-        packages = join_packages(changed_packages, specified_packages)
+        packages = join_packages(changed_packages, specified_packages, eval_options)
 
     for attr in changed_packages:
         for regex in package_regexes:
@@ -407,30 +980,151 @@ def fetch_refs(repo: str, *refs: str) -> List[str]:
     cmd = ["git", "-c", "fetch.prune=false", "fetch", "--force", repo]
     for i, ref in enumerate(refs):
         cmd.append(f"{ref}:refs/nixpkgs-review/{i}")
-    sh(cmd)
-    shas = []
-    for i, ref in enumerate(refs):
+    # concurrent reviews would overwrite each others refs
+    with git_lock:
+        sh(cmd)
+        # one process for all refs instead of one per ref
         out = subprocess.check_output(
-            ["git", "rev-parse", "--verify", f"refs/nixpkgs-review/{i}"], text=True
+            ["git", "rev-parse"]
+            + [f"refs/nixpkgs-review/{i}" for i in range(len(refs))],
+            text=True,
         )
-        shas.append(out.strip())
-    return shas
+    return out.split()
+
+
+def fetch_pull_requests(
+    repo: str, pull_requests: List[Dict[str, Any]]
+) -> Dict[int, Tuple[str, str]]:
+    """
+    Fetches the base branches and heads of all `pull_requests` with a single
+    git fetch and returns the base and head commit of each pull request
+    """
+    refs: Dict[str, None] = {}
+    for pr in pull_requests:
+        refs[pr["base"]["ref"]] = None
+        refs[f"pull/{pr['number']}/head"] = None
+    shas = dict(zip(refs, fetch_refs(repo, *refs)))
+    return {
+        pr["number"]: (shas[pr["base"]["ref"]], shas[f"pull/{pr['number']}/head"])
+        for pr in pull_requests
+    }
+
+
+def attr_path_key(pkg: Package) -> str:
+    return pkg.attr_path
+
+
+def diff_sorted_packages(
+    old: Iterable[Package], new: Iterable[Package]
+) -> Iterator[Tuple[Optional[Package], Optional[Package]]]:
+    """
+    Compare two package streams that are sorted by attribute path in a single
+    pass. Yields `(old, new)` for changed, `(None, new)` for added and
+    `(old, None)` for removed packages.
+    """
+    old_iter = iter(old)
+    new_iter = iter(new)
+    old_pkg = next(old_iter, None)
+    new_pkg = next(new_iter, None)
+    while old_pkg is not None or new_pkg is not None:
+        if new_pkg is None or (
+            old_pkg is not None and old_pkg.attr_path < new_pkg.attr_path
+        ):
+            yield old_pkg, None
+            old_pkg = next(old_iter, None)
+        elif old_pkg is None or new_pkg.attr_path < old_pkg.attr_path:
+            new_pkg.old_pkg = None
+            yield None, new_pkg
+            new_pkg = next(new_iter, None)
+        else:
+            if old_pkg.store_path != new_pkg.store_path:
+                new_pkg.old_pkg = old_pkg
+                yield old_pkg, new_pkg
+            old_pkg = next(old_iter, None)
+            new_pkg = next(new_iter, None)
+
+
+def diff_packages(
+    old: Iterable[Package], new: Iterable[Package]
+) -> Iterator[Tuple[Optional[Package], Optional[Package]]]:
+    """
+    Like `diff_sorted_packages` for unsorted listings, all old packages are
+    kept in a dict while `new` is streamed
+    """
+    old_attrs = dict((pkg.attr_path, pkg) for pkg in old)
+    for new_pkg in new:
+        old_pkg = old_attrs.pop(new_pkg.attr_path, None)
+        if old_pkg is None or old_pkg.store_path != new_pkg.store_path:
+            new_pkg.old_pkg = old_pkg
+            yield old_pkg, new_pkg
+    for old_pkg in old_attrs.values():
+        yield old_pkg, None
 
 
 def differences(
-    old: List[Package], new: List[Package]
+    old: Iterable[Package], new: Iterable[Package]
 ) -> Tuple[List[Package], List[Package]]:
-    old_attrs = dict((pkg.attr_path, pkg) for pkg in old)
     changed_packages = []
-    for new_pkg in new:
-        old_pkg = old_attrs.get(new_pkg.attr_path, None)
-        if old_pkg is None or old_pkg.store_path != new_pkg.store_path:
-            new_pkg.old_pkg = old_pkg
+    removed_packages = []
+    presorted = isinstance(old, SortedPackages) and isinstance(new, SortedPackages)
+    diff = diff_sorted_packages if presorted else diff_packages
+    for old_pkg, new_pkg in diff(old, new):
+        if new_pkg is None:
+            assert old_pkg is not None
+            removed_packages.append(old_pkg)
+        else:
             changed_packages.append(new_pkg)
-        if old_pkg:
-            del old_attrs[old_pkg.attr_path]
 
-    return (changed_packages, list(old_attrs.values()))
+    if not presorted:
+        # report in the same order as sorted listings
+        changed_packages.sort(key=attr_path_key)
+        removed_packages.sort(key=attr_path_key)
+    return (changed_packages, removed_packages)
+
+
+def build_reviews(reviews: List[Review]) -> None:
+    """
+    Builds what the evaluation of each review left pending with one nix build
+    instead of one per review, see `build_union`
+    """
+    reviews = [r for r in reviews if r.pending]
+    if not reviews:
+        return
+    drv_paths = set(a.drv_path for r in reviews for a in r.pending if a.drv_path)
+    if invalid_paths(sorted(drv_paths)) != set():
+        # i.e. derivations of a resumed review were garbage collected
+        warn("Cannot build the derivations directly, building each review separately")
+        for review in reviews:
+            review.build_pending()
+        return
+    first = reviews[0]
+    with ExitStack() as stack:
+        for review in reviews:
+            stack.enter_context(review.phase("build"))
+        build_union(
+            [r.pending for r in reviews],
+            first.build_args,
+            first.builddir.path,
+            first.build_options,
+        )
+    for review in reviews:
+        save_state(review.builddir.path, review.state)
+        review.pending = []
+
+
+def log_options(args: argparse.Namespace) -> LogOptions:
+    return LogOptions(
+        all=args.logs == "all", tail=args.log_tail, compress=args.compress_logs
+    )
+
+
+def build_options(args: argparse.Namespace) -> BuildOptions:
+    return BuildOptions(
+        tiered=args.build_tiers,
+        abort_on_tier_failure=args.abort_on_tier_failure,
+        max_failures=1 if args.fail_fast else args.max_failures,
+        max_failure_ratio=args.max_failure_ratio,
+    )
 
 
 def review_local_revision(
@@ -439,12 +1133,30 @@ def review_local_revision(
     commit: Optional[str],
     staged: bool = False,
 ) -> None:
-    with Builddir(builddir_path) as builddir:
+    worktree_pool = default_worktree_pool() if args.worktree_pool else None
+    with Builddir(
+        builddir_path, resume=args.resume, worktree_pool=worktree_pool
+    ) as builddir:
         review = Review(
             builddir=builddir,
             build_args=args.build_args,
             no_shell=args.no_shell,
             only_packages=set(args.package),
             package_regexes=args.package_regex,
+            eval_parallel=args.eval_parallel,
+            eval_cache=(
+                default_eval_cache()
+                if args.eval_cache or args.eval_incremental
+                else None
+            ),
+            eval_shards=args.eval_shards,
+            eval_memory_limit=args.eval_memory_limit,
+            eval_incremental=args.eval_incremental,
+            eval_workers=args.eval_workers,
+            log_options=log_options(args),
+            history=default_history() if args.history or args.plan else None,
+            plan=args.plan,
+            build_options=build_options(args),
+            resume=args.resume,
         )
         review.review_commit(builddir.path, args.branch, args.remote, commit, staged)
@@ -0,0 +1,107 @@
+import re
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Set
+
+from .utils import warn
+
+# keep the command line of nix-store well below ARG_MAX
+GRAPH_BATCH_SIZE = 1000
+
+GRAPH_EDGE = re.compile(r'^"([^"]+)" -> "([^"]+)"')
+
+
+def store_path_name(path: str) -> str:
+    # nix-store --query --graph labels nodes with the base name of the path
+    return path.rsplit("/", 1)[-1]
+
+
+def dependency_graph(drv_paths: List[str]) -> Dict[str, Set[str]]:
+    """
+    Returns the dependents of each derivation in the closure of `drv_paths`,
+    keyed by the base name of the derivation
+    """
+    dependents: Dict[str, Set[str]] = defaultdict(set)
+    for start in range(0, len(drv_paths), GRAPH_BATCH_SIZE):
+        end = start + GRAPH_BATCH_SIZE
+        batch = drv_paths[start:end]
+        proc = subprocess.run(
+            ["nix-store", "--query", "--graph"] + batch,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+        for line in proc.stdout.splitlines():
+            edge = GRAPH_EDGE.match(line)
+            if edge is not None:
+                dependency, dependent = edge.groups()
+                dependents[dependency].add(dependent)
+    return dependents
+
+
+def fan_out(
+    drv_paths: List[str], dependents: Dict[str, Set[str]]
+) -> Dict[str, Set[str]]:
+    """
+    Returns for each of `drv_paths` which of the other `drv_paths` depend on
+    it, directly or through derivations that are not part of `drv_paths`
+    """
+    names = {store_path_name(p): p for p in drv_paths}
+    result: Dict[str, Set[str]] = {}
+    for name, path in names.items():
+        seen = {name}
+        todo = [name]
+        reached = set()
+        while todo:
+            for dependent in dependents.get(todo.pop(), ()):
+                if dependent in seen:
+                    continue
+                seen.add(dependent)
+                todo.append(dependent)
+                if dependent in names:
+                    reached.add(names[dependent])
+        result[path] = reached
+    return result
+
+
+def build_tiers(drv_paths: List[str]) -> List[List[str]]:
+    """
+    Splits `drv_paths` into tiers that are built one after another. Derivations
+    that other derivations of the set depend on come first, ordered by their
+    dependencies and then by the number of dependents. Everything else is built
+    in the last tier.
+    """
+    try:
+        dependents = dependency_graph(drv_paths)
+    except subprocess.CalledProcessError as e:
+        warn(f"Cannot query the dependency graph, building all at once: {e}")
+        return [drv_paths]
+
+    reached = fan_out(drv_paths, dependents)
+    core = {path for path, others in reached.items() if others}
+    dependencies: Dict[str, Set[str]] = {path: set() for path in core}
+    for path in core:
+        for dependent in reached[path] & core:
+            dependencies[dependent].add(path)
+
+    depth: Dict[str, int] = {}
+
+    def tier_of(path: str) -> int:
+        if path not in depth:
+            depth[path] = 1 + max(
+                (tier_of(dep) for dep in dependencies[path]), default=-1
+            )
+        return depth[path]
+
+    for path in core:
+        tier_of(path)
+    tiers: List[List[str]] = [[] for _ in range(1 + max(depth.values(), default=-1))]
+    for path, index in depth.items():
+        tiers[index].append(path)
+    for tier in tiers:
+        tier.sort(key=lambda p: (-len(reached[p]), p))
+    rest = [p for p in drv_paths if p not in core]
+    if rest:
+        tiers.append(rest)
+    return tiers
@@ -1,5 +1,5 @@
 import os
-from io import StringIO
+from io import BytesIO, StringIO
 from tempfile import TemporaryDirectory
 from typing import Any, List, Optional, Tuple, Union
 from unittest import TestCase
@@ -23,9 +23,21 @@ class MockError(Exception):
 
 
 class MockCompletedProcess:
-    def __init__(self, stdout: Optional[Union[str, StringIO]] = None) -> None:
+    def __init__(
+        self,
+        stdout: Optional[Union[str, StringIO, BytesIO]] = None,
+        stderr: Optional[Union[str, StringIO, List[str]]] = None,
+    ) -> None:
         self.returncode = 0
         self.stdout = stdout
+        self.stderr = stderr
+
+    # also used as the process returned by subprocess.Popen
+    def __enter__(self) -> "MockCompletedProcess":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
 
 
 class Mock:
@@ -92,12 +104,16 @@ build_cmds = [
             "--option",
             "build-use-sandbox",
             "relaxed",
+            "--log-format",
+            "internal-json",
             "-f",
             IgnoreArgument,
             "--builders",
             "ssh://joerg@10.243.29.170 aarch64-linux",
         ],
-        MockCompletedProcess(),
+        MockCompletedProcess(
+            stderr=read_asset("nix-build.log").splitlines(keepends=True)
+        ),
     ),
     (
         [
@@ -112,10 +128,9 @@ build_cmds = [
         ],
         MockCompletedProcess(stdout="x86_64-linux"),
     ),
-    (["nix-store", "--verify-path", IgnoreArgument], MockCompletedProcess()),
     (
-        ["nix", "--experimental-features", "nix-command", "log", IgnoreArgument],
-        MockCompletedProcess(),
+        ["nix-store", "--check-validity", "--print-invalid", IgnoreArgument],
+        MockCompletedProcess(stdout=""),
     ),
     (["nix-shell", IgnoreArgument], MockCompletedProcess()),
     (["git", "worktree", "prune"], MockCompletedProcess()),
@@ -0,0 +1,236 @@
+import email.utils
+import gzip
+import json
+import socket
+import threading
+import time
+import unittest
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Iterator, List
+from unittest import TestCase
+
+from nixpkgs_review.connections import ConnectionPool
+from nixpkgs_review.evalcache import EvalCache
+from nixpkgs_review.github import GithubClient
+from nixpkgs_review.httpcache import HttpCache
+from nixpkgs_review.ratelimit import RequestScheduler
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.connections += 1  # type: ignore
+
+    def do_GET(self) -> None:
+        if self.path == "/redirect":
+            self.reply(302, b"", Location="/pulls/1")
+        elif self.path == "/close":
+            self.reply(200, b"[]", Connection="close")
+        elif self.path == "/etag":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.server.not_modified += 1  # type: ignore
+                self.reply(304, b"", ETag='"v1"')
+            else:
+                self.reply(200, b'{"version": 1}', ETag='"v1"')
+        elif self.path == "/flaky" and self.server.failures < 2:  # type: ignore
+            self.server.failures += 1  # type: ignore
+            self.reply(503, b"Service Unavailable")
+        elif self.path == "/secondary" and self.server.failures < 1:  # type: ignore
+            self.server.failures += 1  # type: ignore
+            body = b'{"message": "You have exceeded a secondary rate limit"}'
+            self.reply(403, body, **{"Retry-After": "3"})
+        elif self.path == "/date" and self.server.failures < 1:  # type: ignore
+            self.server.failures += 1  # type: ignore
+            retry_after = email.utils.formatdate(1005.0, usegmt=True)
+            self.reply(429, b"Too Many Requests", **{"Retry-After": retry_after})
+        elif self.path == "/drop" and self.server.failures < 1:  # type: ignore
+            # closes the connection without a response
+            self.server.failures += 1  # type: ignore
+            self.close_connection = True
+        elif self.path == "/forbidden":
+            self.reply(403, b'{"message": "Resource not accessible"}')
+        elif self.path == "/limited":
+            headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1030"}
+            self.reply(200, b"[]", **headers)
+        elif self.path == "/missing":
+            self.reply(404, b'{"message": "Not Found"}')
+        else:
+            body = json.dumps(dict(path=self.path)).encode("utf-8")
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                self.reply(200, gzip.compress(body), **{"Content-Encoding": "gzip"})
+            else:
+                self.reply(200, body)
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.posts += 1  # type: ignore
+        self.reply(503, b"Service Unavailable")
+
+    def reply(self, status: int, body: bytes, **headers: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+class IdleTimeoutHandler(Handler):
+    # closes keep-alive connections without telling the client
+    timeout = 0.1
+
+
+class ServerTestCase(TestCase):
+    handler = Handler
+
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler)
+        self.server.connections = 0  # type: ignore
+        self.server.not_modified = 0  # type: ignore
+        self.server.failures = 0  # type: ignore
+        self.server.posts = 0  # type: ignore
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.delays: List[float] = []
+        scheduler = RequestScheduler(
+            clock=lambda: 1000.0, sleep=self.delays.append, jitter=lambda: 1.0
+        )
+        self.pool = ConnectionPool(scheduler=scheduler, proxies={})
+        self.client = GithubClient(None, self.pool)
+
+    def tearDown(self) -> None:
+        for conn in self.connections():
+            conn.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def connections(self) -> Iterator[Any]:
+        for idle in self.pool.idle.values():
+            yield from idle
+
+
+class ConnectionPoolTestCase(ServerTestCase):
+    def test_reuse(self) -> None:
+        for number in range(10):
+            pr = self.client.get(f"{self.url}/pulls/{number}")
+            self.assertEqual(pr, dict(path=f"/pulls/{number}"))
+        self.assertEqual(self.pool.connections, 1)
+        self.assertEqual(self.server.connections, 1)  # type: ignore
+
+    def test_redirect(self) -> None:
+        self.assertEqual(self.client.get(f"{self.url}/redirect"), dict(path="/pulls/1"))
+        self.assertEqual(self.server.connections, 1)  # type: ignore
+
+    def test_closed_connection(self) -> None:
+        self.assertEqual(self.client.get(f"{self.url}/close"), [])
+        self.assertEqual(self.client.get(f"{self.url}/pulls/1"), dict(path="/pulls/1"))
+        self.assertEqual(self.server.connections, 2)  # type: ignore
+
+    def test_error(self) -> None:
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.client.get(f"{self.url}/missing")
+        self.assertEqual(cm.exception.code, 404)
+        self.assertEqual(self.client.get(f"{self.url}/pulls/1"), dict(path="/pulls/1"))
+        self.assertEqual(self.server.connections, 1)  # type: ignore
+
+    def test_conditional_request(self) -> None:
+        with TemporaryDirectory() as directory:
+            cache = HttpCache(EvalCache(Path(directory).joinpath("cache.sqlite")))
+            client = GithubClient("token", self.pool, cache)
+            self.assertEqual(client.get(f"{self.url}/etag"), dict(version=1))
+            self.assertEqual(client.get(f"{self.url}/etag"), dict(version=1))
+            self.assertEqual(self.server.not_modified, 1)  # type: ignore
+
+            # responses are not shared between tokens
+            other = GithubClient("other", self.pool, cache)
+            self.assertEqual(other.get(f"{self.url}/etag"), dict(version=1))
+            self.assertEqual(self.server.not_modified, 1)  # type: ignore
+
+    def test_connection_error(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        with self.assertRaises(urllib.error.URLError) as cm:
+            self.client.get(f"http://127.0.0.1:{port}/pulls/1")
+        self.assertIsInstance(cm.exception.reason, ConnectionRefusedError)
+        self.assertEqual(self.delays, [2.0, 4.0, 8.0, 16.0, 32.0])
+
+    def test_proxy(self) -> None:
+        pool = ConnectionPool(proxies=dict(http=self.url))
+        url = "http://nixpkgs-review.invalid/pulls/1"
+        self.assertEqual(GithubClient(None, pool).get(url), dict(path=url))
+        for conn in pool.idle[("http", "nixpkgs-review.invalid")]:
+            conn.close()
+
+
+class RequestSchedulerTestCase(ServerTestCase):
+    def test_retry_server_error(self) -> None:
+        self.assertEqual(self.client.get(f"{self.url}/flaky"), dict(path="/flaky"))
+        self.assertEqual(self.delays, [2.0, 4.0])
+        stats = self.pool.scheduler.stats
+        self.assertEqual((stats.requests, stats.retries), (3, 2))
+        self.assertEqual(stats.wait_time, 6.0)
+
+    def test_no_retry_of_post(self) -> None:
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.client.post(f"{self.url}/flaky", data=dict(body="comment"))
+        self.assertEqual(cm.exception.code, 503)
+        self.assertEqual(self.delays, [])
+
+    def test_secondary_rate_limit(self) -> None:
+        path = "/secondary"
+        self.assertEqual(self.client.get(f"{self.url}{path}"), dict(path=path))
+        self.assertEqual(self.delays, [3.0])
+
+    def test_retry_after_date(self) -> None:
+        self.assertEqual(self.client.get(f"{self.url}/date"), dict(path="/date"))
+        self.assertEqual(self.delays, [5.0])
+
+    def test_retry_connection_error(self) -> None:
+        self.assertEqual(self.client.get(f"{self.url}/drop"), dict(path="/drop"))
+        self.assertEqual(self.delays, [2.0])
+        self.assertEqual(self.pool.scheduler.stats.retries, 1)
+
+    def test_forbidden(self) -> None:
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.client.get(f"{self.url}/forbidden")
+        self.assertEqual(cm.exception.code, 403)
+        self.assertEqual(self.delays, [])
+
+    def test_wait_for_reset(self) -> None:
+        self.assertEqual(self.client.get(f"{self.url}/limited"), [])
+        self.assertEqual(self.delays, [])
+        self.assertEqual(self.client.get(f"{self.url}/pulls/1"), dict(path="/pulls/1"))
+        self.assertEqual(self.delays, [30.0])
+
+
+class StaleConnectionTestCase(ServerTestCase):
+    handler = IdleTimeoutHandler
+
+    def test_stale_connection(self) -> None:
+        self.assertEqual(self.client.get(f"{self.url}/pulls/1"), dict(path="/pulls/1"))
+        time.sleep(0.3)
+        self.assertEqual(self.client.get(f"{self.url}/pulls/2"), dict(path="/pulls/2"))
+        self.assertEqual(self.server.connections, 2)  # type: ignore
+
+    def test_post_uses_new_connection(self) -> None:
+        self.assertEqual(self.client.get(f"{self.url}/pulls/1"), dict(path="/pulls/1"))
+        time.sleep(0.3)
+        with self.assertRaises(urllib.error.HTTPError):
+            self.client.post(f"{self.url}/comments", data=dict(body="comment"))
+        self.assertEqual(self.server.posts, 1)  # type: ignore
+        self.assertEqual(self.pool.connections, 2)
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
@@ -0,0 +1,107 @@
+import unittest
+from io import StringIO
+from typing import Optional
+from unittest.mock import MagicMock, patch
+
+from nixpkgs_review.review import (
+    Package,
+    SortedPackages,
+    decode_packages,
+    differences,
+    encode_packages,
+    iter_packages,
+    parse_packages_xml,
+)
+
+from .cli_mocks import read_asset
+
+
+def mkPackage(attr_path: str, version: str, store_path: Optional[str]) -> Package:
+    return Package(
+        pname=attr_path,
+        version=version,
+        attr_path=attr_path,
+        store_path=store_path,
+        homepage=None,
+        description=None,
+        position=None,
+    )
+
+
+class DifferencesTestcase(unittest.TestCase):
+    def test_differences(self) -> None:
+        old = [
+            mkPackage("zlib", "1.2", "/nix/store/a-zlib"),
+            mkPackage("hello", "2.9", "/nix/store/b-hello"),
+            mkPackage("removed", "1.0", "/nix/store/c-removed"),
+        ]
+        new = [
+            mkPackage("hello", "2.10", "/nix/store/d-hello"),
+            mkPackage("added", "0.1", "/nix/store/e-added"),
+            mkPackage("zlib", "1.2", "/nix/store/a-zlib"),
+        ]
+        changed, removed = differences(old, iter(new))
+
+        self.assertEqual([p.attr_path for p in changed], ["added", "hello"])
+        self.assertIsNone(changed[0].old_pkg)
+        old_hello = changed[1].old_pkg
+        assert old_hello is not None
+        self.assertEqual(old_hello.version, "2.9")
+        self.assertEqual([p.attr_path for p in removed], ["removed"])
+
+    def test_sorted_differences(self) -> None:
+        old = decode_packages(
+            encode_packages(
+                [
+                    mkPackage("zlib", "1.2", "/nix/store/a-zlib"),
+                    mkPackage("hello", "2.9", "/nix/store/b-hello"),
+                    mkPackage("removed", "1.0", "/nix/store/c-removed"),
+                ]
+            )
+        )
+        self.assertIsInstance(old, SortedPackages)
+        new = SortedPackages(
+            [
+                mkPackage("added", "0.1", "/nix/store/e-added"),
+                mkPackage("hello", "2.10", "/nix/store/d-hello"),
+                mkPackage("zlib", "1.2", "/nix/store/a-zlib"),
+            ]
+        )
+        changed, removed = differences(old, new)
+
+        self.assertEqual([p.attr_path for p in changed], ["added", "hello"])
+        old_hello = changed[1].old_pkg
+        assert old_hello is not None
+        self.assertEqual(old_hello.version, "2.9")
+        self.assertEqual([p.attr_path for p in removed], ["removed"])
+
+    def test_parse_packages_xml(self) -> None:
+        packages = list(
+            parse_packages_xml(StringIO(read_asset("package_list_after.txt")))
+        )
+        self.assertEqual(len(packages), 1)
+        pkg = packages[0]
+        self.assertEqual(pkg.attr_path, "pong3d")
+        self.assertEqual(pkg.version, "0.5")
+        self.assertEqual(
+            pkg.store_path, "/nix/store/0436sdzjij4dzf86nr2fbi6yvk98p0gf-3dpong-0.5"
+        )
+        self.assertEqual(pkg.homepage, "http://www.newbreedsoftware.com/3dpong/")
+
+    @patch("subprocess.Popen")
+    def test_memory_limit(self, mock_popen: MagicMock) -> None:
+        nix_env = mock_popen.return_value.__enter__.return_value
+        nix_env.stdout = StringIO(read_asset("package_list_after.txt"))
+        mock_popen.return_value.returncode = 0
+
+        packages = list(iter_packages("nixpkgs", shard=(0, 2), memory_limit=1024))
+
+        self.assertEqual([p.attr_path for p in packages], ["pong3d"])
+        cmd = mock_popen.call_args[0][0]
+        # no preexec_fn, evaluations run in threads
+        self.assertEqual(cmd[:4], ["prlimit", "--as=1073741824", "--", "nix-env"])
+        self.assertNotIn("preexec_fn", mock_popen.call_args[1])
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
@@ -0,0 +1,114 @@
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict
+from unittest.mock import MagicMock, patch
+
+from nixpkgs_review.evalcache import EvalCache
+from nixpkgs_review.nix import AttrCache
+from nixpkgs_review.review import Package, decode_packages, encode_packages
+
+from .cli_mocks import Mock, MockCompletedProcess
+
+
+class EvalCacheTestcase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()
+        self.path = Path(self.directory.name).joinpath("eval-cache.sqlite")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_get_put(self) -> None:
+        cache = EvalCache(self.path)
+        self.assertIsNone(cache.get("foo"))
+        cache.put("foo", b"bar")
+        self.assertEqual(cache.get("foo"), b"bar")
+        # persisted across instances
+        self.assertEqual(EvalCache(self.path).get("foo"), b"bar")
+
+    def test_lru_eviction(self) -> None:
+        cache = EvalCache(self.path, max_size=10)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        # mark `a` as recently used
+        self.assertEqual(cache.get("a"), b"aaaa")
+        cache.put("c", b"cccc")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"aaaa")
+        self.assertEqual(cache.get("c"), b"cccc")
+
+    def test_get_many(self) -> None:
+        cache = EvalCache(self.path)
+        cache.put_many({"a": b"1", "b": b"2"})
+        self.assertEqual(cache.get_many(["a", "b", "c"]), {"a": b"1", "b": b"2"})
+
+    def test_attr_cache(self) -> None:
+        props = {
+            "exists": True,
+            "broken": False,
+            "path": "/nix/store/a",
+            "drvPath": None,
+        }
+        cache = AttrCache(EvalCache(self.path))
+        cache.update({"hello": props})
+        # without a scope results are only kept in memory
+        self.assertEqual(AttrCache(EvalCache(self.path)).lookup({"hello"}), {})
+        self.assertEqual(cache.lookup({"hello", "zlib"}), {"hello": props})
+
+        cache.scope = "attrs:tree1"
+        cache.update({"hello": props})
+        other = AttrCache(EvalCache(self.path))
+        other.scope = "attrs:tree1"
+        self.assertEqual(other.lookup({"hello"}), {"hello": props})
+        other.scope = "attrs:tree2"
+        self.assertEqual(other.lookup({"hello"}), {})
+
+    @patch("subprocess.run")
+    def test_attr_cache_garbage_collected(self, mock_run: MagicMock) -> None:
+        def props(drv_path: str) -> Dict[str, Any]:
+            return dict(exists=True, broken=False, path=None, drvPath=drv_path)
+
+        cache = AttrCache(EvalCache(self.path))
+        cache.scope = "attrs:tree1"
+        cache.update({"hello": props("/nix/store/a.drv"), "zlib": props("/b.drv")})
+        mock_run.side_effect = Mock(
+            [
+                (
+                    [
+                        "nix-store",
+                        "--check-validity",
+                        "--print-invalid",
+                        "/b.drv",
+                        "/nix/store/a.drv",
+                    ],
+                    MockCompletedProcess(stdout="/b.drv\n"),
+                )
+            ]
+        )
+        other = AttrCache(EvalCache(self.path))
+        other.scope = "attrs:tree1"
+        # zlib has to be evaluated again
+        self.assertEqual(
+            other.lookup({"hello", "zlib"}), {"hello": props("/nix/store/a.drv")}
+        )
+
+    def test_encode_packages(self) -> None:
+        pkg = Package(
+            pname="3dpong",
+            version="0.5",
+            attr_path="pong3d",
+            store_path="/nix/store/0436sdzjij4dzf86nr2fbi6yvk98p0gf-3dpong-0.5",
+            homepage=None,
+            description="One or two player 3d sports game",
+            position=None,
+        )
+        decoded = decode_packages(encode_packages([pkg]))
+        self.assertEqual(len(decoded), 1)
+        self.assertEqual(decoded[0].attr_path, pkg.attr_path)
+        self.assertEqual(decoded[0].store_path, pkg.store_path)
+        self.assertEqual(decoded[0].description, pkg.description)
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from nixpkgs_review.review import fetch_pull_requests
+
+from .cli_mocks import Mock, MockCompletedProcess
+
+
+class FetchRefsTestcase(unittest.TestCase):
+    @patch("subprocess.run")
+    def test_fetch_pull_requests(self, mock_run: MagicMock) -> None:
+        mock_run.side_effect = Mock(
+            [
+                (
+                    [
+                        "git",
+                        "-c",
+                        "fetch.prune=false",
+                        "fetch",
+                        "--force",
+                        "https://github.com/NixOS/nixpkgs",
+                        "master:refs/nixpkgs-review/0",
+                        "pull/1/head:refs/nixpkgs-review/1",
+                        "staging:refs/nixpkgs-review/2",
+                        "pull/2/head:refs/nixpkgs-review/3",
+                        "pull/3/head:refs/nixpkgs-review/4",
+                    ],
+                    MockCompletedProcess(),
+                ),
+                (
+                    ["git", "rev-parse"]
+                    + [f"refs/nixpkgs-review/{i}" for i in range(5)],
+                    MockCompletedProcess(stdout="master\npr1\nstaging\npr2\npr3\n"),
+                ),
+            ]
+        )
+        pulls = [
+            {"number": 1, "base": {"ref": "master"}},
+            {"number": 2, "base": {"ref": "staging"}},
+            {"number": 3, "base": {"ref": "master"}},
+        ]
+        self.assertEqual(
+            fetch_pull_requests("https://github.com/NixOS/nixpkgs", pulls),
+            {1: ("master", "pr1"), 2: ("staging", "pr2"), 3: ("master", "pr3")},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
@@ -0,0 +1,79 @@
+import json
+import threading
+import unittest
+import urllib.error
+from typing import Any
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from nixpkgs_review.github import GithubClient
+
+GIST = "https://gist.githubusercontent.com/GrahamcOfBorg/2/raw/"
+
+
+class GithubClientTestCase(TestCase):
+    @patch("nixpkgs_review.connections.ConnectionPool.request")
+    def test_fetch_pull_requests(self, mock_request: MagicMock) -> None:
+        # only passes if both pull requests are requested at the same time
+        barrier = threading.Barrier(2, timeout=5)
+
+        def request(url: str, *args: Any, **kwargs: Any) -> bytes:
+            number = url.rsplit("/", 1)[-1]
+            if "/pulls/" in url:
+                barrier.wait()
+                pr = dict(number=int(number), statuses_url=f"statuses/{number}")
+                return json.dumps(pr).encode("utf-8")
+            if url.endswith("statuses/2"):
+                status = dict(
+                    description="^.^!",
+                    creator=dict(login="ofborg[bot]"),
+                    target_url="https://gist.github.com/2",
+                )
+                return json.dumps([status]).encode("utf-8")
+            if url == GIST:
+                return b"x86_64-linux hello\nx86_64-linux world\n"
+            return b"[]"
+
+        mock_request.side_effect = request
+        pulls = GithubClient(None).fetch_pull_requests([1, 2], borg_eval=True)
+
+        self.assertEqual(list(pulls), [1, 2])
+        self.assertEqual(pulls[1].data["number"], 1)
+        self.assertIsNone(pulls[1].borg_eval)
+        self.assertEqual(pulls[2].borg_eval, {"x86_64-linux": {"hello", "world"}})
+
+    @patch("nixpkgs_review.connections.ConnectionPool.request")
+    def test_fetch_pull_requests_error(self, mock_request: MagicMock) -> None:
+        def request(url: str, *args: Any, **kwargs: Any) -> bytes:
+            if url.endswith("/pulls/1"):
+                raise urllib.error.HTTPError(url, 502, "Bad Gateway", {}, None)  # type: ignore
+            if "/pulls/" in url:
+                return json.dumps(dict(number=2)).encode("utf-8")
+            return b"[]"
+
+        mock_request.side_effect = request
+        pulls = GithubClient(None).fetch_pull_requests([1, 2], borg_eval=False)
+
+        # the failed pull request is fetched again by `Review.fetch_pr`
+        self.assertEqual(list(pulls), [2])
+
+    @patch("nixpkgs_review.connections.ConnectionPool.request")
+    def test_fetch_pull_requests_connection_error(
+        self, mock_request: MagicMock
+    ) -> None:
+        def request(url: str, *args: Any, **kwargs: Any) -> bytes:
+            if url.endswith("/pulls/2"):
+                raise ConnectionRefusedError(111, "Connection refused")
+            if "/pulls/" in url:
+                number = int(url.rsplit("/", 1)[-1])
+                return json.dumps(dict(number=number)).encode("utf-8")
+            return b"[]"
+
+        mock_request.side_effect = request
+        pulls = GithubClient(None).fetch_pull_requests([1, 2, 3], borg_eval=False)
+
+        self.assertEqual(list(pulls), [1, 3])
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
@@ -1,7 +1,7 @@
 import os
 from pathlib import Path
 from typing import Any, List, Tuple
-from unittest.mock import MagicMock, mock_open, patch
+from unittest.mock import MagicMock, patch
 
 from nixpkgs_review.cli import main
 
@@ -9,7 +9,7 @@ from .cli_mocks import CliTestCase, IgnoreArgument, Mock, MockCompletedProcess
 
 
 def dummy_api_response() -> List[Tuple[Any, Any]]:
-    return [(IgnoreArgument, mock_open(read_data="{}")())]
+    return [(IgnoreArgument, b"{}")]
 
 
 class GithubActions(CliTestCase):
@@ -18,8 +18,8 @@ class GithubActions(CliTestCase):
         os.environ["PR"] = "1"
 
     @patch("subprocess.run")
-    @patch("urllib.request.urlopen")
-    def test_post_result(self, mock_run: MagicMock, mock_urlopen: MagicMock) -> None:
+    @patch("nixpkgs_review.connections.ConnectionPool.request")
+    def test_post_result(self, mock_run: MagicMock, mock_request: MagicMock) -> None:
         directory = Path(self.directory.name)
         nix_instantiate = [
             (
@@ -28,7 +28,7 @@ class GithubActions(CliTestCase):
             )
         ]
         effects = Mock(nix_instantiate + dummy_api_response())
-        mock_urlopen.side_effect = effects
+        mock_request.side_effect = effects
         mock_run.side_effect = effects
 
         report = os.path.join(self.directory.name, "report.md")
@@ -42,12 +42,12 @@ class GithubActions(CliTestCase):
             ["post-result"],
         )
 
-    @patch("urllib.request.urlopen")
-    def test_merge(self, mock_urlopen: MagicMock) -> None:
-        mock_urlopen.side_effect = Mock(dummy_api_response())
+    @patch("nixpkgs_review.connections.ConnectionPool.request")
+    def test_merge(self, mock_request: MagicMock) -> None:
+        mock_request.side_effect = Mock(dummy_api_response())
         main("nixpkgs-review", ["merge"])
 
-    @patch("urllib.request.urlopen")
-    def test_approve(self, mock_urlopen: MagicMock) -> None:
-        mock_urlopen.side_effect = Mock(dummy_api_response())
+    @patch("nixpkgs_review.connections.ConnectionPool.request")
+    def test_approve(self, mock_request: MagicMock) -> None:
+        mock_request.side_effect = Mock(dummy_api_response())
         main("nixpkgs-review", ["approve"])
@@ -0,0 +1,54 @@
+import sqlite3
+import unittest
+from contextlib import closing
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from nixpkgs_review.history import History, Run
+from nixpkgs_review.nix import Attr
+from nixpkgs_review.report import Report
+
+
+def attr(name: str, built: bool, build_time: float) -> Attr:
+    a = Attr(name, True, False, False, f"/nix/store/{name}", f"/nix/store/{name}.drv")
+    a._path_verified = built
+    a.build_time = build_time
+    return a
+
+
+class HistoryTestcase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()
+        self.history = History(Path(self.directory.name).joinpath("history.sqlite"))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_record(self) -> None:
+        for started, build_time in [(1.0, 10.0), (2.0, 30.0)]:
+            report = Report("x86_64-linux", [attr("hello", True, build_time)])
+            run = Run("pr", "1234", "x86_64-linux", started, {"build": build_time})
+            self.history.record(run, report)
+        report = Report("x86_64-linux", [attr("hello", False, 5.0)])
+        self.history.record(Run("rev", "abcdef", "x86_64-linux", 3.0), report)
+
+        runs = self.history.runs()
+        self.assertEqual([r.target for r in runs], ["abcdef", "1234", "1234"])
+        self.assertEqual((runs[0].built, runs[0].failed), (0, 1))
+        self.assertEqual(runs[1].phases, {"build": 30.0})
+
+        builds = self.history.builds("hello", limit=2)
+        self.assertEqual([b.outcome for b in builds], ["failed", "built"])
+        self.assertEqual([b.build_time for b in builds], [5.0, 30.0])
+        self.assertEqual(builds[0].drv_path, "/nix/store/hello.drv")
+
+    def test_runs_use_index(self) -> None:
+        with closing(sqlite3.connect(str(self.history.path))) as db:
+            plan = db.execute(
+                "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM builds WHERE run = 1"
+            ).fetchall()
+        self.assertIn("builds_run", plan[0][-1])
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
@@ -0,0 +1,88 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from nixpkgs_review.incremental import DependencyIndex
+
+from .cli_mocks import MockCompletedProcess
+
+
+def mkIndex() -> DependencyIndex:
+    return DependencyIndex.build(
+        "/src/nixpkgs",
+        [
+            (
+                "hello",
+                "/src/nixpkgs/pkgs/by-name/he/hello/package.nix:12",
+                "/nix/store/a-hello.drv",
+            ),
+            (
+                "zlib",
+                "/src/nixpkgs/pkgs/development/libraries/zlib/default.nix:5",
+                "/nix/store/b-zlib.drv",
+            ),
+            (
+                "curl",
+                "/src/nixpkgs/pkgs/tools/networking/curl/default.nix:1",
+                "/nix/store/c-curl.drv",
+            ),
+        ],
+    )
+
+
+class DependencyIndexTestcase(unittest.TestCase):
+    def test_symlinked_checkout(self) -> None:
+        with TemporaryDirectory() as directory:
+            worktree = os.path.realpath(os.path.join(directory, "worktree"))
+            os.mkdir(worktree)
+            link = os.path.join(directory, "nixpkgs")
+            os.symlink(worktree, link)
+            position = f"{worktree}/pkgs/by-name/he/hello/package.nix:12"
+            index = DependencyIndex.build(link, [("hello", position, None)])
+        self.assertEqual(index.entries, [("hello", "pkgs/by-name/he/hello", None)])
+
+    def test_file_attrs(self) -> None:
+        index = DependencyIndex.decode(mkIndex().encode())
+        self.assertEqual(
+            index.file_attrs("pkgs/by-name/he/hello/package.nix"), {"hello"}
+        )
+        self.assertEqual(index.file_attrs("pkgs/by-name/fo/foo/package.nix"), {"foo"})
+        self.assertEqual(
+            index.file_attrs("pkgs/development/libraries/zlib/fix.patch"), {"zlib"}
+        )
+        self.assertEqual(
+            index.file_attrs("pkgs/development/libraries/zlib/patches/a.patch"),
+            {"zlib"},
+        )
+        self.assertIsNone(index.file_attrs("pkgs/top-level/all-packages.nix"))
+        self.assertIsNone(index.file_attrs("lib/strings.nix"))
+        self.assertIsNone(index.file_attrs("default.nix"))
+
+    @patch("subprocess.run")
+    def test_affected_attrs(self, mock_run: MagicMock) -> None:
+        mock_run.return_value = MockCompletedProcess(
+            stdout="/nix/store/b-zlib.drv\n/nix/store/c-curl.drv\n"
+        )
+        index = mkIndex()
+        self.assertEqual(
+            index.affected_attrs(["pkgs/development/libraries/zlib/default.nix"]),
+            {"zlib", "curl"},
+        )
+        self.assertEqual(
+            mock_run.call_args[0][0],
+            ["nix-store", "--query", "--referrers-closure", "/nix/store/b-zlib.drv"],
+        )
+
+    @patch("subprocess.run")
+    def test_garbage_collected(self, mock_run: MagicMock) -> None:
+        proc = MockCompletedProcess()
+        proc.returncode = 1
+        mock_run.return_value = proc
+        self.assertIsNone(
+            mkIndex().affected_attrs(["pkgs/development/libraries/zlib/default.nix"])
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
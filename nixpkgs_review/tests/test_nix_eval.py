@@ -0,0 +1,73 @@
+import json
+import threading
+import unittest
+from typing import Any, Dict, List
+from unittest.mock import MagicMock, patch
+
+from nixpkgs_review.nix import Attr, EvalOptions, _nix_eval_attrs, verify_paths
+
+from .cli_mocks import Mock, MockCompletedProcess
+
+
+class NixEvalTestCase(unittest.TestCase):
+    @patch("subprocess.run")
+    def test_chunks(self, mock_run: MagicMock) -> None:
+        lock = threading.Lock()
+        chunks: List[List[str]] = []
+
+        def run(cmd: List[str], **kwargs: Any) -> MockCompletedProcess:
+            self.assertEqual(cmd[:3], ["prlimit", "--as=2147483648", "--"])
+            # (import evalAttrs.nix <attr json>)
+            with open(cmd[-1].rstrip(")").split()[-1]) as f:
+                attrs = json.load(f)
+            with lock:
+                chunks.append(attrs)
+            result: Dict[str, Any] = {
+                name: dict(exists=True, broken=False, path=None, drvPath=None)
+                for name in attrs
+            }
+            return MockCompletedProcess(stdout=json.dumps(result))
+
+        mock_run.side_effect = run
+        attrs = set(f"package{i}" for i in range(450))
+        results = _nix_eval_attrs(attrs, EvalOptions(workers=2, memory_limit=2048))
+
+        self.assertEqual(sorted(len(chunk) for chunk in chunks), [225, 225])
+        self.assertEqual(set(chunks[0]) & set(chunks[1]), set())
+        self.assertEqual(results.keys(), attrs)
+
+    @patch("subprocess.run")
+    def test_small_sets_are_not_split(self, mock_run: MagicMock) -> None:
+        mock_run.return_value = MockCompletedProcess(stdout="{}")
+        _nix_eval_attrs(set(f"package{i}" for i in range(150)), EvalOptions(workers=4))
+        mock_run.assert_called_once()
+        self.assertEqual(mock_run.call_args[0][0][0], "nix")
+
+
+class VerifyPathsTestCase(unittest.TestCase):
+    @patch("nixpkgs_review.nix.VERIFY_BATCH_SIZE", 2)
+    @patch("subprocess.run")
+    def test_batches(self, mock_run: MagicMock) -> None:
+        attrs = [
+            Attr(name, True, False, False, f"/nix/store/{name}", f"/{name}.drv")
+            for name in ["c", "a", "b"]
+        ]
+        attrs.append(Attr("missing", False, False, False, None, None))
+        check = ["nix-store", "--check-validity", "--print-invalid"]
+        mock_run.side_effect = Mock(
+            [
+                (
+                    check + ["/nix/store/a", "/nix/store/b"],
+                    MockCompletedProcess(stdout="/nix/store/b\n"),
+                ),
+                (check + ["/nix/store/c"], MockCompletedProcess(stdout="")),
+            ]
+        )
+
+        verify_paths(attrs)
+        self.assertEqual([a.was_build() for a in attrs[:3]], [True, True, False])
+        self.assertIsNone(attrs[3]._path_verified)
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
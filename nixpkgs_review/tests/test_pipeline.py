@@ -0,0 +1,37 @@
+import threading
+import time
+import unittest
+from typing import List
+
+from nixpkgs_review.pipeline import Stage, run_pipeline
+
+
+class PipelineTestcase(unittest.TestCase):
+    def test_overlap(self) -> None:
+        building = threading.Event()
+        evaluated: List[int] = []
+
+        def evaluate(item: int) -> None:
+            if item == 1:
+                # the second item is evaluated while the first one builds
+                self.assertTrue(building.wait(timeout=10))
+            evaluated.append(item)
+
+        def build(item: int) -> None:
+            if item == 0:
+                building.set()
+                while len(evaluated) < 2:
+                    time.sleep(0.01)
+            if item == 2:
+                raise RuntimeError("build failed")
+
+        errors = run_pipeline(
+            [0, 1, 2],
+            [Stage("evaluate", 1, evaluate), Stage("build", 1, build)],
+        )
+        self.assertEqual(evaluated, [0, 1, 2])
+        self.assertEqual(list(errors), [2])
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
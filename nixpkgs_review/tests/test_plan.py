@@ -0,0 +1,71 @@
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from nixpkgs_review.history import History, Run
+from nixpkgs_review.nix import Attr
+from nixpkgs_review.plan import build_plan
+from nixpkgs_review.report import Report
+
+from .cli_mocks import Mock, MockCompletedProcess
+
+DRY_RUN = """these 2 derivations will be built:
+  /nix/store/aaa-hello-2.12.drv
+  /nix/store/bbb-world-1.0.drv
+these 3 paths will be fetched (1.50 MiB download, 6.00 MiB unpacked):
+  /nix/store/ccc-glibc-2.33
+  /nix/store/ddd-bash-5.1
+  /nix/store/eee-gcc-10.3.0-lib
+"""
+
+
+def attr(name: str, drv_path: str) -> Attr:
+    return Attr(name, True, False, False, f"/nix/store/{name}", drv_path)
+
+
+class PlanTestcase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()
+        self.history = History(Path(self.directory.name).joinpath("history.sqlite"))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    @patch("subprocess.run")
+    def test_build_plan(self, mock_run: MagicMock) -> None:
+        hello = attr("hello", "/nix/store/aaa-hello-2.12.drv")
+        hello._path_verified = True
+        for build_time in [10.0, 20.0, 60.0]:
+            hello.build_time = build_time
+            run = Run("pr", "1", "x86_64-linux", build_time)
+            self.history.record(run, Report("x86_64-linux", [hello]))
+
+        attrs = [hello, attr("world", "/nix/store/bbb-world-1.0.drv")]
+        mock_run.side_effect = Mock(
+            [
+                (
+                    [
+                        "nix-store",
+                        "--realise",
+                        "--dry-run",
+                        "/nix/store/aaa-hello-2.12.drv",
+                        "/nix/store/bbb-world-1.0.drv",
+                    ],
+                    MockCompletedProcess(stderr=DRY_RUN),
+                )
+            ]
+        )
+        plan = build_plan(attrs, self.history)
+
+        self.assertEqual(len(plan.builds), 2)
+        self.assertEqual(len(plan.fetches), 3)
+        self.assertEqual(plan.download_size, int(1.5 * 1024 * 1024))
+        self.assertEqual(plan.unpacked_size, 6 * 1024 * 1024)
+        self.assertEqual(plan.build_times, {"hello": 20.0})
+        self.assertEqual(plan.unknown_build_times, ["world"])
+        self.assertEqual(plan.estimated_build_time(), 20.0)
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
@@ -1,6 +1,6 @@
 import unittest
 from typing import Any, List, Tuple
-from unittest.mock import MagicMock, mock_open, patch
+from unittest.mock import MagicMock, patch
 
 from nixpkgs_review.cli import main
 
@@ -16,14 +16,14 @@ from .cli_mocks import (
 
 def borg_eval_cmds() -> List[Tuple[Any, Any]]:
     return [
-        (IgnoreArgument, mock_open(read_data=read_asset("github-pull-37200.json"))()),
+        (IgnoreArgument, read_asset("github-pull-37200.json").encode("utf-8")),
         (
             IgnoreArgument,
-            mock_open(read_data=read_asset("github-pull-37200-statuses.json"))(),
+            read_asset("github-pull-37200-statuses.json").encode("utf-8"),
         ),
         (
             "https://gist.githubusercontent.com/GrahamcOfBorg/4c9ebc3e608308c6096202375b0dc902/raw/",
-            read_asset("gist-37200.txt").encode("utf-8").split(b"\n"),
+            read_asset("gist-37200.txt").encode("utf-8"),
         ),
         (
             [
@@ -39,12 +39,8 @@ def borg_eval_cmds() -> List[Tuple[Any, Any]]:
             MockCompletedProcess(),
         ),
         (
-            ["git", "rev-parse", "--verify", "refs/nixpkgs-review/0"],
-            MockCompletedProcess(stdout="hash1\n"),
-        ),
-        (
-            ["git", "rev-parse", "--verify", "refs/nixpkgs-review/1"],
-            MockCompletedProcess(stdout="hash2\n"),
+            ["git", "rev-parse", "refs/nixpkgs-review/0", "refs/nixpkgs-review/1"],
+            MockCompletedProcess(stdout="hash1\nhash2\n"),
         ),
         (["git", "worktree", "add", IgnoreArgument, "hash1"], MockCompletedProcess()),
         (["git", "merge", "--no-commit", "hash2"], MockCompletedProcess()),
@@ -65,14 +61,16 @@ def borg_eval_cmds() -> List[Tuple[Any, Any]]:
 
 
 class PrCommandTestCase(CliTestCase):
-    @patch("urllib.request.urlopen")
+    @patch("nixpkgs_review.connections.ConnectionPool.request")
     @patch("subprocess.run")
+    @patch("subprocess.Popen")
     def test_pr_command_borg_eval(
-        self, mock_run: MagicMock, mock_urlopen: MagicMock
+        self, mock_popen: MagicMock, mock_run: MagicMock, mock_request: MagicMock
     ) -> None:
         effects = Mock(borg_eval_cmds() + build_cmds)
         mock_run.side_effect = effects
-        mock_urlopen.side_effect = effects
+        mock_request.side_effect = effects
+        mock_popen.side_effect = effects
 
         main(
             "nixpkgs-review",
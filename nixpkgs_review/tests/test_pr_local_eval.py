@@ -1,7 +1,7 @@
 import unittest
 from io import StringIO
 from typing import Any, List, Tuple
-from unittest.mock import MagicMock, mock_open, patch
+from unittest.mock import MagicMock, patch
 
 from nixpkgs_review.cli import main
 
@@ -17,10 +17,10 @@ from .cli_mocks import (
 
 def local_eval_cmds() -> List[Tuple[Any, Any]]:
     return [
-        (IgnoreArgument, mock_open(read_data=read_asset("github-pull-1.json"))()),
+        (IgnoreArgument, read_asset("github-pull-1.json").encode("utf-8")),
         (
             IgnoreArgument,
-            mock_open(read_data=read_asset("github-pull-1-statuses.json"))(),
+            read_asset("github-pull-1-statuses.json").encode("utf-8"),
         ),
         (
             [
@@ -36,12 +36,8 @@ def local_eval_cmds() -> List[Tuple[Any, Any]]:
             MockCompletedProcess(),
         ),
         (
-            ["git", "rev-parse", "--verify", "refs/nixpkgs-review/0"],
-            MockCompletedProcess(stdout="hash1\n"),
-        ),
-        (
-            ["git", "rev-parse", "--verify", "refs/nixpkgs-review/1"],
-            MockCompletedProcess(stdout="hash2\n"),
+            ["git", "rev-parse", "refs/nixpkgs-review/0", "refs/nixpkgs-review/1"],
+            MockCompletedProcess(stdout="hash1\nhash2\n"),
         ),
         (["git", "worktree", "add", IgnoreArgument, "hash1"], 0),
         (IgnoreArgument, MockCompletedProcess(stdout=StringIO("<items></items>"))),
@@ -54,18 +50,16 @@ def local_eval_cmds() -> List[Tuple[Any, Any]]:
 
 
 class PrCommandTestcase(CliTestCase):
-    @patch("urllib.request.urlopen")
+    @patch("nixpkgs_review.connections.ConnectionPool.request")
     @patch("subprocess.run")
     @patch("subprocess.Popen")
     def test_local_eval(
-        self, mock_popen: MagicMock, mock_run: MagicMock, mock_urlopen: MagicMock
+        self, mock_popen: MagicMock, mock_run: MagicMock, mock_request: MagicMock
     ) -> None:
         effects = Mock(local_eval_cmds() + build_cmds)
-        mock_urlopen.side_effect = effects
+        mock_request.side_effect = effects
         mock_run.side_effect = effects
-
-        popen_instance = mock_popen.return_value
-        popen_instance.__enter__.side_effect = effects
+        mock_popen.side_effect = effects
 
         main(
             "nixpkgs-review",
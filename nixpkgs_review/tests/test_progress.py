@@ -0,0 +1,140 @@
+import io
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Iterator
+from unittest.mock import MagicMock, patch
+
+from nixpkgs_review.cli import parse_args
+from nixpkgs_review.nix import (
+    Attr,
+    BuildOptions,
+    build_attrs,
+    build_union,
+    record_build_times,
+)
+from nixpkgs_review.progress import BuildProgress
+
+from .cli_mocks import Mock, MockCompletedProcess, read_asset
+
+DRV = "/nix/store/0k8ivb7pm8j0fvkjn9f9yj7mfvzvjlbr-pong3d-0.0.1.drv"
+GLIBC = "/nix/store/9krlzvny65gdc8s7kpb6lkx8cd02c25b-glibc-2.33"
+
+
+def clock() -> Iterator[float]:
+    t = 0.0
+    while True:
+        t += 1.0
+        yield t
+
+
+class BuildProgressTestCase(unittest.TestCase):
+    def test_build_times(self) -> None:
+        ticks = clock()
+        progress = BuildProgress(clock=lambda: next(ticks))
+        for line in read_asset("nix-build.log").splitlines(keepends=True):
+            progress.feed(line)
+
+        self.assertEqual(progress.running, {})
+        self.assertEqual(progress.builds[DRV].duration(), 1.0)
+        self.assertFalse(progress.builds[DRV].failed)
+        self.assertTrue(progress.substitutions[GLIBC].substituted)
+
+        pong3d = Attr("pong3d", True, False, False, "/nix/store/out", DRV)
+        glibc = Attr("glibc", True, False, False, GLIBC, "/nix/store/glibc.drv")
+        record_build_times([pong3d, glibc], progress)
+        self.assertEqual(pong3d.build_time, 1.0)
+        self.assertFalse(pong3d.substituted)
+        self.assertTrue(glibc.substituted)
+
+    def test_failed_build(self) -> None:
+        progress = BuildProgress()
+        progress.feed(
+            '@nix {"action":"msg","level":0,"msg":"\\u001b[31;1merror:\\u001b[0m '
+            f"builder for '\\u001b[35;1m{DRV}\\u001b[0m' failed with exit code 2\"}}\n"
+        )
+        self.assertTrue(progress.builds[DRV].failed)
+
+    @patch("sys.stderr", new_callable=io.StringIO)
+    def test_build_logs(self, stderr: io.StringIO) -> None:
+        progress = BuildProgress()
+        progress.feed(
+            f'@nix {{"action":"start","id":1,"type":105,"fields":["{DRV}"]}}\n'
+        )
+        progress.feed(
+            '@nix {"action":"result","id":1,"type":101,"fields":["make all"]}\n'
+        )
+        progress.feed('@nix {"action":"result","id":1,"type":104,"fields":[1]}\n')
+        self.assertTrue(stderr.getvalue().endswith("pong3d-0.0.1> make all\n"))
+
+    @patch("subprocess.run")
+    @patch("subprocess.Popen")
+    def test_max_failures(self, mock_popen: MagicMock, mock_run: MagicMock) -> None:
+        hello = Attr("hello", True, False, False, "/nix/store/hello", DRV)
+        world = Attr("world", True, False, False, "/nix/store/world", "/world.drv")
+        proc = mock_popen.return_value.__enter__.return_value
+        proc.stderr = [
+            '@nix {"action":"msg","level":0,'
+            f'"msg":"error: builder for \'{DRV}\' failed with exit code 1"}}\n',
+            "unreachable\n",
+        ]
+        invalid = "/nix/store/hello\n/nix/store/world\n"
+        mock_run.side_effect = Mock(
+            [
+                (
+                    [
+                        "nix-store",
+                        "--check-validity",
+                        "--print-invalid",
+                        "/nix/store/hello",
+                        "/nix/store/world",
+                    ],
+                    MockCompletedProcess(stdout=invalid),
+                )
+            ]
+        )
+
+        with TemporaryDirectory() as directory:
+            build_attrs(
+                [hello, world], "", Path(directory), BuildOptions(max_failures=1)
+            )
+        proc.terminate.assert_called_once()
+        self.assertFalse(hello.skipped)
+        self.assertTrue(world.skipped)
+
+    @patch("sys.stderr", new_callable=io.StringIO)
+    def test_invalid_failure_limits(self, stderr: io.StringIO) -> None:
+        for flags in (
+            ["--max-failures", "0"],
+            ["--max-failure-ratio", "0"],
+            ["--max-failure-ratio", "1.5"],
+        ):
+            with self.assertRaises(SystemExit):
+                parse_args("nixpkgs-review", ["rev", "HEAD"] + flags)
+        args = parse_args("nixpkgs-review", ["rev", "HEAD", "--max-failure-ratio", "1"])
+        self.assertEqual(args.max_failure_ratio, 1.0)
+
+    @patch("subprocess.Popen")
+    def test_build_union(self, mock_popen: MagicMock) -> None:
+        proc = mock_popen.return_value.__enter__.return_value
+        proc.stderr = read_asset("nix-build.log").splitlines(keepends=True)
+        first = [Attr("pong3d", True, False, False, "/nix/store/out", DRV)]
+        second = [
+            Attr("pong3d", True, False, False, "/nix/store/out", DRV),
+            Attr("hello", True, False, False, "/nix/store/hello", "/hello.drv"),
+            Attr("broken", True, True, False, None, None),
+        ]
+
+        with TemporaryDirectory() as directory:
+            build_union([first, second], "", Path(directory))
+
+        mock_popen.assert_called_once()
+        command = mock_popen.call_args[0][0]
+        self.assertEqual(command[-2:], ["/hello.drv^*", f"{DRV}^*"])
+        self.assertIsNotNone(first[0].build_time)
+        self.assertEqual(first[0].build_time, second[0].build_time)
+        self.assertIsNone(second[1].build_time)
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
@@ -1,7 +1,12 @@
+import gzip
 import unittest
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
 
 from nixpkgs_review.nix import Attr
-from nixpkgs_review.report import Report
+from nixpkgs_review.report import LogOptions, Report, write_error_logs
 
 from .cli_mocks import read_asset
 
@@ -34,6 +39,25 @@ class ReportTestcase(unittest.TestCase):
 
         self.assertEqual(expected, actual)
 
+    @patch("subprocess.Popen")
+    def test_write_error_logs(self, mock_popen: MagicMock) -> None:
+        "Test that only logs of failed builds are written"
+        proc = mock_popen.return_value.__enter__.return_value
+        proc.stdout = StringIO("line1\nline2\nline3\n")
+
+        with TemporaryDirectory() as directory:
+            options = LogOptions(tail=2, compress=True)
+            write_error_logs(
+                [mkAttr("foo", True), mkAttr("baz", False)], Path(directory), options
+            )
+            logs = Path(directory).joinpath("logs")
+            self.assertEqual(sorted(p.name for p in logs.iterdir()), ["baz.log.gz"])
+            with gzip.open(logs.joinpath("baz.log.gz"), "rt") as f:
+                self.assertEqual(
+                    f.read(),
+                    "# last 2 lines, full log: nix log some_drv_path\nline2\nline3\n",
+                )
+
 
 if __name__ == "__main__":
     unittest.main(failfast=True)
@@ -3,7 +3,9 @@ from io import StringIO
 from typing import Any, List, Tuple
 from unittest.mock import MagicMock, patch
 
+from nixpkgs_review.builddir import Builddir
 from nixpkgs_review.cli import main
+from nixpkgs_review.utils import cache_home
 
 from .cli_mocks import (
     CliTestCase,
@@ -34,7 +36,7 @@ def rev_command_cmds() -> List[Tuple[Any, Any]]:
             MockCompletedProcess(),
         ),
         (
-            ["git", "rev-parse", "--verify", "refs/nixpkgs-review/0"],
+            ["git", "rev-parse", "refs/nixpkgs-review/0"],
             MockCompletedProcess(stdout="hash1\n"),
         ),
         (["git", "worktree", "add", IgnoreArgument, "hash1"], MockCompletedProcess()),
@@ -53,19 +55,106 @@ class RevCommand(CliTestCase):
     def test_rev_command(self, mock_popen: MagicMock, mock_run: MagicMock) -> None:
         effects = Mock(rev_command_cmds() + build_cmds)
         mock_run.side_effect = effects
+        mock_popen.side_effect = effects
 
-        popen_instance = mock_popen.return_value
-        popen_instance.__enter__.side_effect = effects
+        main(
+            "nixpkgs-review",
+            [
+                "rev",
+                "--build-args",
+                '--builders "ssh://joerg@10.243.29.170 aarch64-linux"',
+                "HEAD",
+            ],
+        )
+
+    @patch("subprocess.run")
+    @patch("subprocess.Popen")
+    def test_rev_resume(self, mock_popen: MagicMock, mock_run: MagicMock) -> None:
+        effects = Mock(rev_command_cmds() + build_cmds)
+        mock_run.side_effect = effects
+        mock_popen.side_effect = effects
+        args = [
+            "rev",
+            "--build-args",
+            '--builders "ssh://joerg@10.243.29.170 aarch64-linux"',
+            "HEAD",
+        ]
+        main("nixpkgs-review", args)
+
+        # neither fetched, evaluated nor built again
+        effects = Mock(
+            [
+                (
+                    ["git", "rev-parse", "--verify", "HEAD"],
+                    MockCompletedProcess(stdout="hash1\n"),
+                ),
+                (
+                    ["git", "worktree", "add", IgnoreArgument, "hash1"],
+                    MockCompletedProcess(),
+                ),
+                (["git", "merge", "--no-commit", "hash1"], MockCompletedProcess()),
+                # nix-store --check-validity before nix eval
+                build_cmds[3],
+                build_cmds[2],
+            ]
+            + build_cmds[4:]
+        )
+        mock_run.side_effect = effects
+        mock_popen.side_effect = effects
+        main("nixpkgs-review", args + ["--resume"])
+
+    @patch("subprocess.run")
+    @patch("subprocess.Popen")
+    def test_rev_eval_parallel(
+        self, mock_popen: MagicMock, mock_run: MagicMock
+    ) -> None:
+        cmds = rev_command_cmds()
+        base_worktree_add = (
+            ["git", "worktree", "add", IgnoreArgument, "hash1"],
+            MockCompletedProcess(),
+        )
+        # base and merged tree are evaluated concurrently, in any order
+        effects = Mock(cmds[:4] + [base_worktree_add, cmds[5]] + build_cmds)
+        evaluated = []
+
+        def run(cmd: List[str], *args: Any, **kwargs: Any) -> Any:
+            if cmd[0] != "nix-env":
+                return effects(cmd, *args, **kwargs)
+            path = cmd[cmd.index("-f") + 1]
+            evaluated.append(path.rsplit("/", 1)[-1])
+            if path.endswith("nixpkgs-base"):
+                return MockCompletedProcess(stdout=StringIO("<items></items>"))
+            asset = read_asset("package_list_after.txt")
+            return MockCompletedProcess(stdout=StringIO(asset))
+
+        mock_run.side_effect = run
+        mock_popen.side_effect = run
 
         main(
             "nixpkgs-review",
             [
                 "rev",
+                "--eval-parallel",
                 "--build-args",
                 '--builders "ssh://joerg@10.243.29.170 aarch64-linux"',
                 "HEAD",
             ],
         )
+        self.assertEqual(sorted(evaluated), ["nixpkgs", "nixpkgs-base"])
+
+    @patch("subprocess.run")
+    def test_resume_killed_review(self, mock_run: MagicMock) -> None:
+        cache = cache_home()
+        assert cache is not None
+        # left behind by a killed review with --eval-parallel
+        cache.joinpath("rev-hash1", "nixpkgs-base").mkdir(parents=True)
+        cache.joinpath("rev-hash1", "nixpkgs").mkdir()
+        prune = (["git", "worktree", "prune"], MockCompletedProcess())
+        mock_run.side_effect = Mock([prune, prune])
+
+        with Builddir("rev-hash1", resume=True) as builddir:
+            self.assertFalse(builddir.base_worktree_dir.exists())
+            self.assertEqual(builddir.path, cache.joinpath("rev-hash1"))
 
 
 if __name__ == "__main__":
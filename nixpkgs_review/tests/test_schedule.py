@@ -0,0 +1,43 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from nixpkgs_review.schedule import build_tiers
+
+from .cli_mocks import Mock, MockCompletedProcess
+
+LIB = "/nix/store/aaa-libfoo-1.0.drv"
+PLUGIN = "/nix/store/bbb-foo-plugin-1.0.drv"
+APP = "/nix/store/ccc-app-1.0.drv"
+TOOL = "/nix/store/ddd-tool-1.0.drv"
+OTHER = "/nix/store/eee-other-1.0.drv"
+
+# app depends on the plugin and (via a wrapper) on libfoo, tool on libfoo
+GRAPH = """digraph G {
+"aaa-libfoo-1.0.drv" [label = "libfoo-1.0.drv", shape = box, style = filled, fillcolor = "#ff0000"];
+"aaa-libfoo-1.0.drv" -> "bbb-foo-plugin-1.0.drv" [color = "black"];
+"aaa-libfoo-1.0.drv" -> "fff-wrapper.drv" [color = "red"];
+"fff-wrapper.drv" -> "ccc-app-1.0.drv" [color = "green"];
+"bbb-foo-plugin-1.0.drv" -> "ccc-app-1.0.drv" [color = "blue"];
+"aaa-libfoo-1.0.drv" -> "ddd-tool-1.0.drv" [color = "black"];
+"ggg-stdenv.drv" -> "eee-other-1.0.drv" [color = "black"];
+}
+"""
+
+
+class ScheduleTestcase(unittest.TestCase):
+    @patch("subprocess.run")
+    def test_build_tiers(self, mock_run: MagicMock) -> None:
+        drv_paths = [APP, LIB, OTHER, PLUGIN, TOOL]
+        mock_run.side_effect = Mock(
+            [
+                (
+                    ["nix-store", "--query", "--graph"] + drv_paths,
+                    MockCompletedProcess(stdout=GRAPH),
+                )
+            ]
+        )
+        self.assertEqual(build_tiers(drv_paths), [[LIB], [PLUGIN], [APP, OTHER, TOOL]])
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
@@ -1,5 +1,5 @@
 import unittest
-from io import StringIO
+from io import BytesIO, StringIO
 from typing import Any, List, Tuple
 from unittest.mock import MagicMock, patch
 
@@ -34,11 +34,15 @@ def wip_command_cmds() -> List[Tuple[Any, Any]]:
             MockCompletedProcess(),
         ),
         (
-            ["git", "rev-parse", "--verify", "refs/nixpkgs-review/0"],
+            ["git", "rev-parse", "refs/nixpkgs-review/0"],
             MockCompletedProcess(stdout="hash1\n"),
         ),
         (["git", "worktree", "add", IgnoreArgument, "hash1"], MockCompletedProcess()),
         (IgnoreArgument, MockCompletedProcess(stdout=StringIO("<items></items>"))),
+        (
+            ["git", "--no-pager", "diff"],
+            MockCompletedProcess(stdout=BytesIO(b"diff --git a/pkgs b/pkgs\n")),
+        ),
         (["git", "apply"], MockCompletedProcess()),
         (
             IgnoreArgument,
@@ -53,9 +57,7 @@ class WipCommand(CliTestCase):
     def test_wip_command(self, mock_popen: MagicMock, mock_run: MagicMock) -> None:
         effects = Mock(wip_command_cmds() + build_cmds)
         mock_run.side_effect = effects
-
-        popen_instance = mock_popen.return_value
-        popen_instance.__enter__.side_effect = effects
+        mock_popen.side_effect = effects
 
         main(
             "nixpkgs-review",
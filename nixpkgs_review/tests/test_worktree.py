@@ -0,0 +1,65 @@
+import os
+import subprocess
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from nixpkgs_review.worktree import WorktreePool
+
+
+def git(*args: str) -> str:
+    return subprocess.run(
+        ["git", *args], check=True, stdout=subprocess.PIPE, text=True
+    ).stdout.strip()
+
+
+class WorktreePoolTestcase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cwd = os.getcwd()
+        self.directory = TemporaryDirectory()
+        root = Path(self.directory.name)
+        self.repo = root.joinpath("repo")
+        self.repo.mkdir()
+        os.chdir(self.repo)
+        git("init", "--quiet")
+        self.repo.joinpath("default.nix").write_text("1")
+        git("add", "default.nix")
+        git("-c", "user.name=test", "-c", "user.email=test@test", "commit", "-qm", "1")
+        self.first = git("rev-parse", "HEAD")
+        self.repo.joinpath("default.nix").write_text("2")
+        git("-c", "user.name=test", "-c", "user.email=test@test", "commit", "-qam", "2")
+        self.second = git("rev-parse", "HEAD")
+        self.pool = WorktreePool(root.joinpath("worktrees"))
+
+    def tearDown(self) -> None:
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_reuse(self) -> None:
+        worktree = self.pool.lease()
+        worktree.checkout(self.first)
+        self.assertEqual(worktree.path.joinpath("default.nix").read_text(), "1")
+        # leftovers of the previous review
+        worktree.path.joinpath("default.nix").write_text("changed")
+        worktree.path.joinpath("untracked").write_text("")
+        worktree.release()
+
+        worktree = self.pool.lease()
+        worktree.checkout(self.second)
+        self.assertEqual(worktree.path.joinpath("default.nix").read_text(), "2")
+        self.assertFalse(worktree.path.joinpath("untracked").exists())
+        worktree.release()
+
+    def test_concurrent_leases(self) -> None:
+        first = self.pool.lease()
+        second = self.pool.lease()
+        self.assertNotEqual(first.path, second.path)
+        first.release()
+        third = self.pool.lease()
+        self.assertEqual(first.path, third.path)
+        second.release()
+        third.release()
+
+
+if __name__ == "__main__":
+    unittest.main(failfast=True)
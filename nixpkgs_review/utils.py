@@ -23,6 +23,16 @@ info = color_text(32)
 link = color_text(34)
 
 
+def cache_home() -> Optional[Path]:
+    xdg_cache_raw = os.environ.get("XDG_CACHE_HOME")
+    if xdg_cache_raw is not None:
+        return Path(xdg_cache_raw).joinpath("nixpkgs-review")
+    home = os.environ.get("HOME", None)
+    if home is None:
+        return None
+    return Path(home).joinpath(".cache", "nixpkgs-review")
+
+
 def sh(
     command: List[str], cwd: Optional[Union[Path, str]] = None
 ) -> "subprocess.CompletedProcess[str]":
@@ -30,6 +40,16 @@ def sh(
     return subprocess.run(command, cwd=cwd, check=True, text=True)
 
 
+def memory_limit_command(command: List[str], limit: Optional[int]) -> List[str]:
+    """
+    Caps the address space of `command` to `limit` MiB with prlimit. Unlike a
+    `preexec_fn` this is safe in processes with threads.
+    """
+    if limit is None:
+        return command
+    return ["prlimit", f"--as={limit * 1024 * 1024}", "--"] + command
+
+
 def verify_commit_hash(commit: str) -> str:
     cmd = ["git", "rev-parse", "--verify", commit]
     proc = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True)
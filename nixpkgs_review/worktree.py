@@ -0,0 +1,77 @@
+import fcntl
+import hashlib
+import shutil
+import subprocess
+from pathlib import Path
+from typing import IO, Any, Optional
+
+from .utils import cache_home, info, sh, warn
+
+
+class Worktree:
+    """
+    A persistent git worktree leased from a `WorktreePool`. Instead of a fresh
+    checkout it is reset to the reviewed commit, which only touches the files
+    that differ.
+    """
+
+    def __init__(self, path: Path, lock: IO[Any]) -> None:
+        self.path = path
+        self.lock = lock
+
+    def checkout(self, commit: str) -> None:
+        if self.path.joinpath(".git").exists():
+            try:
+                sh(["git", "reset", "--quiet", "--hard", commit], cwd=self.path)
+                sh(["git", "clean", "--quiet", "-ffdx"], cwd=self.path)
+                return
+            except subprocess.CalledProcessError:
+                warn(f"Cannot reset worktree {self.path}, checking it out again")
+                shutil.rmtree(self.path)
+                sh(["git", "worktree", "prune"])
+        sh(["git", "worktree", "add", "--detach", str(self.path), commit])
+
+    def release(self) -> None:
+        fcntl.flock(self.lock, fcntl.LOCK_UN)
+        self.lock.close()
+
+
+class WorktreePool:
+    """
+    Worktrees of one nixpkgs repository that are reused between reviews. Each
+    worktree is protected by a lock file, so that concurrent reviews lease
+    different worktrees.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def lease(self) -> Worktree:
+        slot = 0
+        while True:
+            lock = open(self.directory.joinpath(f"{slot}.lock"), "a+")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                slot += 1
+                continue
+            path = self.directory.joinpath(str(slot))
+            info(f"Using worktree {path}")
+            return Worktree(path, lock)
+
+
+def default_worktree_pool() -> Optional[WorktreePool]:
+    cache = cache_home()
+    if cache is None:
+        return None
+    git_dir = subprocess.run(
+        ["git", "rev-parse", "--path-format=absolute", "--git-common-dir"],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout.strip()
+    # worktrees belong to the repository they were created from
+    repo = hashlib.sha256(git_dir.encode("utf-8")).hexdigest()[:16]
+    return WorktreePool(cache.joinpath("worktrees", repo))